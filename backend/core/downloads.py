@@ -0,0 +1,134 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.http import content_disposition_header
+
+# Bytes per read/write when a file is streamed through Python (ranges, servers without
+# sendfile); FileResponse's default is 4KB
+STREAM_BLOCK_SIZE = 512 * 1024
+
+
+class _FileRange:
+    """File-like over length bytes of f from offset, for FileResponse.
+
+    Deliberately has no fileno/tell/seek, so WSGI servers iterate it rather than
+    sendfile() the rest of the file.
+    """
+    def __init__(self, f, offset, length):
+        f.seek(offset)
+        self._f = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def _advise_sequential(f, offset=0, length=0):
+    # Larger kernel readahead for the span about to be streamed; length 0 means to the end
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a Range header, None to send it all, ValueError when unsatisfiable.
+
+    Only a single bytes=a-b, a- or -n range is honoured; anything else, including
+    multi-range headers, gets the whole file.
+    """
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    start, sep, end = header[6:].strip().partition('-')
+    # Both sides digits or empty, and not both empty
+    if not sep or not (start + end).isdecimal():
+        return None
+    if not start:
+        # bytes=-N: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def file_download_response(path, content_type, filename, as_attachment=True, request=None):
+    """Response for a stored file, FileNotFoundError when it is missing on disk.
+
+    With DOWNLOAD_ACCEL_REDIRECT_PREFIX set, files under MEDIA_ROOT are handed to nginx via
+    X-Accel-Redirect so the worker returns immediately and nginx answers Range requests;
+    otherwise they are streamed, honouring a single-range Range header when request is given.
+    as_attachment=False serves the file inline (previews, players).
+    """
+    prefix = settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        media_root = os.path.join(os.path.realpath(settings.MEDIA_ROOT), '')
+        real_path = os.path.realpath(path)
+        if real_path.startswith(media_root):
+            if not os.path.isfile(real_path):
+                raise FileNotFoundError(path)
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(real_path[len(media_root):])
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+            return response
+
+    f = open(path, 'rb')
+    range_header = request.META.get('HTTP_RANGE') if request is not None else None
+    if range_header:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            f.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            _advise_sequential(f, start, end - start + 1)
+            response = FileResponse(
+                _FileRange(f, start, end - start + 1), status=206,
+                content_type=content_type, as_attachment=as_attachment, filename=filename
+            )
+            response.block_size = STREAM_BLOCK_SIZE
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    # Streamed in blocks (or via wsgi.file_wrapper/sendfile), never held in memory whole
+    _advise_sequential(f)
+    response = FileResponse(f, content_type=content_type, as_attachment=as_attachment, filename=filename)
+    response.block_size = STREAM_BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    """MEDIA_URL view for runs without nginx (DEBUG), like django.views.static.serve plus Range"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    try:
+        return file_download_response(
+            full_path, content_type, os.path.basename(full_path), as_attachment=False, request=request
+        )
+    except (FileNotFoundError, IsADirectoryError):
+        raise Http404(path)
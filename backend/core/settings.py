@@ -68,6 +68,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse a worker's connection across requests instead of reopening it on each one
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -103,11 +106,16 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON (falls back to json.dumps when orjson is missing)
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -152,6 +160,49 @@ DEFAULT_CHUNK_SIZE = 'large'
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024 * 1024
 CONCURRENT_CHUNKS = 4
 
+# Redis URL for sharing chunked-upload progress across FastAPI workers,
+# progress stays in-process when unset
+UPLOAD_STATE_REDIS_URL = os.environ.get('UPLOAD_STATE_REDIS_URL')
+
+# 'shared' holds entries that other processes invalidate (cached JWT users, storage_stats,
+# projects_list): the FastAPI service and the Django workers must see the same store, so
+# without CACHE_REDIS_URL it is a no-op rather than per-process memory that would go stale.
+# 'default' only holds self-validating entries and may stay per-process.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    _REDIS_CACHE = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}
+    CACHES = {'default': _REDIS_CACHE, 'shared': _REDIS_CACHE}
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    }
+
+# Seconds a GPU usage reading is reused before nvidia-smi/NVML is queried again
+GPU_POLL_INTERVAL_SECONDS = float(os.environ.get('GPU_POLL_INTERVAL_SECONDS', '5'))
+# Seconds a host with no GPU at all (no NVML devices, no nvidia-smi) is remembered as such
+GPU_ABSENT_TTL_SECONDS = float(os.environ.get('GPU_ABSENT_TTL_SECONDS', '3600'))
+# Seconds a failed GPU query is remembered on a host that does have one
+GPU_FAILURE_TTL_SECONDS = float(os.environ.get('GPU_FAILURE_TTL_SECONDS', '60'))
+# ffprobe processes allowed to run at once per server process
+FFPROBE_MAX_CONCURRENCY = int(os.environ.get('FFPROBE_MAX_CONCURRENCY', min(os.cpu_count() or 1, 4)))
+
+# Videos of at least this many bytes get an HLS rendition (stream copy) after upload; 0 disables
+HLS_MIN_SIZE = int(os.environ.get('HLS_MIN_SIZE', '0'))
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+
+# Generated thumbnails, reused until the source changes. Kept under MEDIA_ROOT so cache hits
+# go out through DOWNLOAD_ACCEL_REDIRECT_PREFIX like any other file
+THUMB_CACHE_DIR = os.environ.get('THUMB_CACHE_DIR', os.path.join(MEDIA_ROOT, 'thumbs'))
+THUMB_CACHE_MAX_BYTES = int(os.environ.get('THUMB_CACHE_MAX_BYTES', 1024 ** 3))
+
+# Internal nginx location that serves MEDIA_ROOT (e.g. '/protected/'). When set, file
+# downloads answer with X-Accel-Redirect and nginx sends the bytes; unset streams from Django
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.environ.get('DOWNLOAD_ACCEL_REDIRECT_PREFIX', '')
+
+# Slice size for streaming an incoming UploadFile to disk
+UPLOAD_READ_CHUNK = 512 * 1024  # 512KB
+
 # Network condition thresholds
 NETWORK_CONDITIONS = {
     'weak': {
@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from core.downloads import serve_media
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -27,4 +27,5 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # Preview stream_urls point here when nginx isn't in front; players need Range to seek
+    urlpatterns += [re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', serve_media)]
\ No newline at end of file
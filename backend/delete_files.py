@@ -17,7 +17,6 @@ def delete_all_files():
         
         for file_obj in files:
             file_size = file_obj.size
-            user = file_obj.user
             
             try:
                 if file_obj.file and hasattr(file_obj.file, 'path'):
@@ -27,8 +26,8 @@ def delete_all_files():
             except (ValueError, AttributeError):
                 pass
             
-            user.update_storage_used(file_size, subtract=True)
             total_size_freed += file_size
+            # File.delete() subtracts the size from the owner's storage_used
             file_obj.delete()
         
         chunks = ChunkedUpload.objects.all()
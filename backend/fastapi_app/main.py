@@ -4,8 +4,13 @@ import django
 from pathlib import Path
 import asyncio
 import aiofiles
+import errno
+import functools
 import hashlib
-from typing import Optional, Dict, List
+import json
+import mmap
+import uuid
+from typing import Optional, Dict, List, Literal
 import tempfile
 import logging
 import time
@@ -19,36 +24,108 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 django.setup()
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Form, APIRouter, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Form, APIRouter, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils import timezone
 from storage.models import File as DjangoFile, Folder, ChunkedUpload, Project
-from pydantic import BaseModel
+from users.models import invalidate_user_caches, on_user_cache_invalidated
+from pydantic import BaseModel, ValidationError
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
 # Import video processor
 try:
     from video_processing.video_processor import process_uploaded_video, VideoProcessor, GPUMonitor
+    from video_processing.hls import build_hls_playlist, wants_hls
     VIDEO_PROCESSING_AVAILABLE = True
 except ImportError:
     VIDEO_PROCESSING_AVAILABLE = False
     logging.warning("Video processing not available. Install ffmpeg and create video_processing module.")
 
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+try:
+    from blake3 import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+try:
+    from cachetools import TTLCache
+    CACHETOOLS_AVAILABLE = True
+except ImportError:
+    CACHETOOLS_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="NAS FastAPI", version="1.0.0")
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # Non-string keys (ints, UUIDs) encode as they do with JSONResponse
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+# Response class for the JSON endpoints, orjson encodes in C when it is installed
+APIResponse = ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+
+app = FastAPI(title="NAS FastAPI", version="1.0.0", default_response_class=APIResponse)
 router = APIRouter()
 
 # Dynamic chunk size support
 DEFAULT_CHUNK_SIZE = 20 * 1024 * 1024  # 20MB default
 MAX_CONCURRENT_CHUNKS = 4
+# Upper bound on in-flight chunks per client: 8 x xlarge (50MB) = 400MB buffered
+MAX_PARALLEL_CHUNKS = 8
+READ_SLICE = getattr(settings, 'UPLOAD_READ_CHUNK', 512 * 1024)
+WRITE_BATCH = 8 * 1024 * 1024
+# Suffix of the single file that offset-addressed chunks are written into
+PART_SUFFIX = '.part'
 TEMP_CLEANUP_INTERVAL = 1800
+# Period of the stale upload sweep in periodic_cleanup
+CLEANUP_PERIOD = 3600
+
+# Base directory for per-session chunk dirs, resolved once at import
+_CHUNKS_BASE = os.path.join(settings.MEDIA_ROOT, 'uploads', 'chunks')
+
+# Scratch dir for the video test endpoint
+_TEST_TEMP_DIR = os.path.join(settings.MEDIA_ROOT, 'temp', 'test')
+
+# Chunk dirs already created by this process, so makedirs runs once per session
+_MADE_DIRS: set = set()
+
+def ensure_dir(path: str):
+    if path not in _MADE_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _MADE_DIRS.add(path)
+
+ChunkSizeName = Literal['small', 'medium', 'large', 'xlarge']
 
 def get_chunk_size(chunk_size_name: str = 'large') -> int:
     """Get chunk size in bytes based on configuration name"""
@@ -67,61 +144,152 @@ app.add_middleware(
 )
 
 User = get_user_model()
-active_uploads: Dict[str, Dict] = {}
 
-# Thread pool cho video processing
-video_processing_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video_proc")
+UPLOAD_STATE_TTL = 24 * 3600
+
+class LocalUploadState:
+    """Upload progress kept in this process, used when Redis is not configured"""
+    def __init__(self):
+        self._uploads: Dict[str, Dict] = {}
+    
+    async def add_chunk(self, upload_key: str, record: Dict, total_chunks: int) -> int:
+        upload = self._uploads.setdefault(upload_key, {'total_chunks': total_chunks, 'records': {}})
+        upload['records'][record['chunk_number']] = record
+        upload['touched'] = time.monotonic()
+        return len(upload['records'])
+    
+    async def get(self, upload_key: str) -> Optional[Dict]:
+        upload = self._uploads.get(upload_key)
+        if upload is None:
+            return None
+        return {'total_chunks': upload['total_chunks'], 'records': list(upload['records'].values())}
+    
+    async def discard(self, upload_key: str):
+        self._uploads.pop(upload_key, None)
+    
+    def expire(self):
+        """Drop uploads with no chunk for UPLOAD_STATE_TTL, as Redis does with its key TTL"""
+        cutoff = time.monotonic() - UPLOAD_STATE_TTL
+        for upload_key in [k for k, upload in self._uploads.items() if upload['touched'] < cutoff]:
+            del self._uploads[upload_key]
+
+class RedisUploadState:
+    """Upload progress shared by all workers, expires after UPLOAD_STATE_TTL"""
+    def __init__(self, url: str):
+        self._redis = aioredis.from_url(url, decode_responses=True)
+    
+    async def add_chunk(self, upload_key: str, record: Dict, total_chunks: int) -> int:
+        meta_key, records_key = f"up:{upload_key}:meta", f"up:{upload_key}:records"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(meta_key, 'total_chunks', total_chunks)
+            pipe.hset(records_key, record['chunk_number'], json.dumps(record))
+            pipe.expire(meta_key, UPLOAD_STATE_TTL)
+            pipe.expire(records_key, UPLOAD_STATE_TTL)
+            pipe.hlen(records_key)
+            results = await pipe.execute()
+        return results[-1]
+    
+    async def get(self, upload_key: str) -> Optional[Dict]:
+        total_chunks = await self._redis.hget(f"up:{upload_key}:meta", 'total_chunks')
+        if total_chunks is None:
+            return None
+        records = await self._redis.hvals(f"up:{upload_key}:records")
+        return {'total_chunks': int(total_chunks), 'records': [json.loads(r) for r in records]}
+    
+    async def discard(self, upload_key: str):
+        await self._redis.delete(f"up:{upload_key}:meta", f"up:{upload_key}:records")
+    
+    def expire(self):
+        pass
+
+# Serializes the chunk-0 reset against chunk bookkeeping of the same upload. The locks are
+# per process, so this assumes all chunks of one upload reach the same worker (a single
+# uvicorn worker, or sticky routing in front of several).
+_upload_locks: Dict[str, asyncio.Lock] = {}
+_upload_lock_used: Dict[str, float] = {}
+
+def get_upload_lock(upload_key: str) -> asyncio.Lock:
+    _upload_lock_used[upload_key] = time.monotonic()
+    return _upload_locks.setdefault(upload_key, asyncio.Lock())
+
+def drop_upload_lock(upload_key: str):
+    _upload_locks.pop(upload_key, None)
+    _upload_lock_used.pop(upload_key, None)
+
+def expire_upload_locks():
+    """Forget locks of uploads abandoned for UPLOAD_STATE_TTL, along with their upload state"""
+    cutoff = time.monotonic() - UPLOAD_STATE_TTL
+    for upload_key in [k for k, used in _upload_lock_used.items() if used < cutoff]:
+        if not _upload_locks[upload_key].locked():
+            drop_upload_lock(upload_key)
+
+if settings.UPLOAD_STATE_REDIS_URL and REDIS_AVAILABLE:
+    upload_state = RedisUploadState(settings.UPLOAD_STATE_REDIS_URL)
+else:
+    if settings.UPLOAD_STATE_REDIS_URL:
+        logger.warning("UPLOAD_STATE_REDIS_URL is set but redis is not installed, keeping upload state in-process")
+    upload_state = LocalUploadState()
+
+# Bounded video job queue, complete_upload waits for a slot when it is full
+VIDEO_QUEUE_SIZE = 32
+VIDEO_JOB_RETRIES = 3
+# Seconds to wait on a GPU query before treating the GPU as unavailable
+GPU_QUERY_TIMEOUT = 2.0
+video_q: asyncio.Queue = asyncio.Queue(maxsize=VIDEO_QUEUE_SIZE)
+
+# Thread pool for chunk disk writes, one hop per WRITE_BATCH instead of per slice
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+
+_EXT_MAP = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg', 
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+    'tiff': 'image/tiff',
+    'ico': 'image/x-icon',
+    'mp4': 'video/mp4',
+    'avi': 'video/x-msvideo',
+    'mov': 'video/quicktime',
+    'wmv': 'video/x-ms-wmv',
+    'flv': 'video/x-flv',
+    'webm': 'video/webm',
+    'mkv': 'video/x-matroska',
+    '3gp': 'video/3gpp',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'flac': 'audio/flac',
+    'aac': 'audio/aac',
+    'm4a': 'audio/mp4',
+    'pdf': 'application/pdf',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'html': 'text/html',
+    'css': 'text/css',
+    'js': 'application/javascript',
+    'py': 'text/x-python',
+    'zip': 'application/zip',
+    'rar': 'application/vnd.rar',
+    'tar': 'application/x-tar',
+    'gz': 'application/gzip',
+    '7z': 'application/x-7z-compressed'
+}
 
 def detect_content_type(filename):
-    content_type, _ = mimetypes.guess_type(filename)
+    _, sep, extension = filename.rpartition('.')
+    content_type = _EXT_MAP.get(extension.lower()) if sep else None
     if content_type:
         return content_type
     
-    extension = filename.lower().split('.')[-1] if '.' in filename else ''
-    
-    extension_map = {
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg', 
-        'png': 'image/png',
-        'gif': 'image/gif',
-        'bmp': 'image/bmp',
-        'webp': 'image/webp',
-        'svg': 'image/svg+xml',
-        'tiff': 'image/tiff',
-        'ico': 'image/x-icon',
-        'mp4': 'video/mp4',
-        'avi': 'video/x-msvideo',
-        'mov': 'video/quicktime',
-        'wmv': 'video/x-ms-wmv',
-        'flv': 'video/x-flv',
-        'webm': 'video/webm',
-        'mkv': 'video/x-matroska',
-        '3gp': 'video/3gpp',
-        'mp3': 'audio/mpeg',
-        'wav': 'audio/wav',
-        'ogg': 'audio/ogg',
-        'flac': 'audio/flac',
-        'aac': 'audio/aac',
-        'm4a': 'audio/mp4',
-        'pdf': 'application/pdf',
-        'doc': 'application/msword',
-        'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'txt': 'text/plain',
-        'csv': 'text/csv',
-        'json': 'application/json',
-        'xml': 'application/xml',
-        'html': 'text/html',
-        'css': 'text/css',
-        'js': 'application/javascript',
-        'py': 'text/x-python',
-        'zip': 'application/zip',
-        'rar': 'application/vnd.rar',
-        'tar': 'application/x-tar',
-        'gz': 'application/gzip',
-        '7z': 'application/x-7z-compressed'
-    }
-    
-    return extension_map.get(extension, 'application/octet-stream')
+    content_type, _ = mimetypes.guess_type(filename)
+    return content_type or 'application/octet-stream'
 
 class ChunkUploadRequest(BaseModel):
     filename: str
@@ -129,68 +297,148 @@ class ChunkUploadRequest(BaseModel):
     total_chunks: int
     total_size: int
     chunk_hash: Optional[str] = None
+    chunk_offset: Optional[int] = None
     project_id: str
     folder_id: Optional[str] = None
 
+class ChunkFormReceiver:
+    """Parses a chunk upload's multipart body, streaming the file part straight to disk.
+
+    Starlette's form parser spools file parts to a temporary file first, which
+    doubles the disk writes for every chunk. Here the file part goes to
+    staging_path in WRITE_BATCH pwrites on the I/O executor, and the form
+    fields are collected as strings. When chunk_hash arrives before the file
+    part, the data is hashed in the same executor hop that writes it.
+    """
+    MAX_FIELD_SIZE = 64 * 1024
+    
+    def __init__(self, staging_path: str):
+        self.staging_path = staging_path
+        self.fields: Dict[str, str] = {}
+        self.has_file = False
+        self.file_content_type = None
+        self.bytes_written = 0
+        self.hasher = None
+        self._fd = None
+        self._pending = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b''
+        self._header_value = b''
+        self._field_name = None
+        self._field_data = bytearray()
+        self._in_file = False
+    
+    def on_part_begin(self):
+        self._headers = {}
+        self._field_name = None
+        self._field_data = bytearray()
+        self._in_file = False
+    
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+    
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b''
+        self._header_value = b''
+    
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._field_name = options.get(b'name', b'').decode('utf-8', 'replace')
+        if b'filename' in options:
+            if self.has_file:
+                raise HTTPException(status_code=400, detail="Only one file part is allowed")
+            self.has_file = True
+            self._in_file = True
+            self.file_content_type = self._headers.get(b'content-type', b'').decode('latin-1') or None
+            if BLAKE3_AVAILABLE and self.fields.get('chunk_hash'):
+                self.hasher = blake3()
+            self._fd = os.open(self.staging_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._pending += data[start:end]
+        else:
+            if len(self._field_data) + end - start > self.MAX_FIELD_SIZE:
+                raise HTTPException(status_code=400, detail=f"Form field '{self._field_name}' is too large")
+            self._field_data += data[start:end]
+    
+    def on_part_end(self):
+        if not self._in_file:
+            self.fields[self._field_name] = self._field_data.decode('utf-8', 'replace')
+    
+    async def _flush(self, loop):
+        if not self._pending:
+            return
+        data, self._pending = self._pending, bytearray()
+        await loop.run_in_executor(io_executor, hash_and_pwrite, self._fd, data, self.bytes_written, self.hasher)
+        self.bytes_written += len(data)
+    
+    async def receive(self, request: Request):
+        _, params = parse_options_header(request.headers.get('content-type', ''))
+        boundary = params.get(b'boundary')
+        if not boundary:
+            raise HTTPException(status_code=400, detail="Missing multipart boundary")
+        
+        parser = MultipartParser(boundary, {
+            'on_part_begin': self.on_part_begin,
+            'on_part_data': self.on_part_data,
+            'on_part_end': self.on_part_end,
+            'on_header_field': self.on_header_field,
+            'on_header_value': self.on_header_value,
+            'on_header_end': self.on_header_end,
+            'on_headers_finished': self.on_headers_finished,
+        })
+        loop = asyncio.get_event_loop()
+        try:
+            async for data in request.stream():
+                parser.write(data)
+                if len(self._pending) >= WRITE_BATCH:
+                    await self._flush(loop)
+            parser.finalize()
+            await self._flush(loop)
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
 class CompleteUploadRequest(BaseModel):
     filename: str
     project_id: str
     folder_id: Optional[str] = None
 
-@sync_to_async
-def get_user_by_id(user_id):
-    return User.objects.get(id=user_id)
+async def get_user_by_id(user_id):
+    # Upload handlers only need the quota fields, the rest stays deferred
+    return await User.objects.only('id', 'storage_used', 'storage_quota').aget(id=user_id)
 
-@sync_to_async
-def check_user_storage_space(user, total_size):
-    return user.has_storage_space(total_size)
-
-@sync_to_async
-def get_project_by_id(project_id, user):
+async def get_project_by_id(project_id, user):
     try:
-        project = Project.objects.get(id=project_id, user=user)
-        return project
-    except Project.DoesNotExist:
+        return await Project.objects.aget(id=project_id, user=user)
+    except (Project.DoesNotExist, ValueError, DjangoValidationError):
         raise Exception("Project not found")
 
-@sync_to_async
-def get_folder_by_id(folder_id, user):
-    try:
-        folder = Folder.objects.select_related('project').get(id=folder_id)
-        if folder.user != user:
-            raise Exception("Folder does not belong to user")
-        return folder
-    except Folder.DoesNotExist:
-        raise Exception("Folder not found")
+async def get_project_and_folder(project_id, folder_id, user):
+    """Fetch the target project and optional folder in one query.
 
-@sync_to_async
-def create_or_update_chunked_upload_record(temp_file_path, filename, content_type, chunk_number, total_chunks, total_size, user, project, folder):
+    When a folder is given its project comes along via select_related, so the
+    project lookup is skipped entirely.
+    """
+    if not folder_id:
+        try:
+            return await get_project_by_id(project_id, user), None
+        except Exception:
+            raise HTTPException(status_code=404, detail="Project not found")
+    
     try:
-        chunk_record = ChunkedUpload.objects.get(
-            user=user,
-            filename=filename,
-            chunk_number=chunk_number,
-            project=project
-        )
-        chunk_record.file = temp_file_path
-        chunk_record.content_type = content_type
-        chunk_record.total_chunks = total_chunks
-        chunk_record.total_size = total_size
-        chunk_record.folder = folder
-        chunk_record.save()
-        return chunk_record
-    except ChunkedUpload.DoesNotExist:
-        return ChunkedUpload.objects.create(
-            file=temp_file_path,
-            filename=filename,
-            content_type=content_type,
-            chunk_number=chunk_number,
-            total_chunks=total_chunks,
-            total_size=total_size,
-            user=user,
-            project=project,
-            folder=folder
-        )
+        folder = await Folder.objects.select_related('project').aget(id=folder_id, user=user)
+    except (Folder.DoesNotExist, ValueError, DjangoValidationError):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    if str(folder.project_id) != str(project_id) or folder.project.user_id != user.id:
+        raise HTTPException(status_code=400, detail="Folder does not belong to specified project")
+    return folder.project, folder
 
 @sync_to_async
 def cleanup_existing_chunks(user, project, filename):
@@ -199,12 +447,11 @@ def cleanup_existing_chunks(user, project, filename):
         project=project,
         filename=filename
     )
-    for chunk in chunks:
-        if os.path.exists(chunk.file):
-            try:
-                os.remove(chunk.file)
-            except OSError:
-                pass
+    for chunk in chunks.only('id', 'file'):
+        try:
+            os.unlink(chunk.file)
+        except OSError:
+            pass
     chunks.delete()
 
 @sync_to_async
@@ -244,45 +491,99 @@ def create_final_file_with_video_processing(name, content_type, size, user, proj
 
 @sync_to_async
 def get_chunks_for_upload(user, project, filename):
-    return list(ChunkedUpload.objects.filter(user=user, project=project, filename=filename).order_by('chunk_number'))
+    return list(
+        ChunkedUpload.objects.filter(user=user, project=project, filename=filename)
+        .only('id', 'file', 'chunk_number', 'total_chunks', 'total_size')
+        .order_by('chunk_number')
+    )
 
 @sync_to_async
 def update_user_storage(user, size):
     user.update_storage_used(size)
 
 @sync_to_async
-def delete_chunk(chunk):
-    chunk.delete()
+def delete_chunks_for_upload(user, project, filename):
+    ChunkedUpload.objects.filter(user=user, project=project, filename=filename).delete()
 
-@sync_to_async
-def filter_chunks_by_upload(user, project, filename):
-    return ChunkedUpload.objects.filter(user=user, project=project, filename=filename)
+def get_manifest_path(upload_key: str) -> str:
+    return f"{_CHUNKS_BASE}/{upload_key}.manifest"
+
+def append_manifest(manifest_path, record):
+    with open(manifest_path, 'a') as manifest:
+        manifest.write(json.dumps(record) + '\n')
+
+def read_manifest(manifest_path) -> List[Dict]:
+    # Later lines win, a re-sent chunk replaces its earlier record
+    records = {}
+    try:
+        with open(manifest_path) as manifest:
+            for line in manifest:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record['chunk_number']] = record
+    except FileNotFoundError:
+        pass
+    return list(records.values())
+
+async def load_upload_chunks(upload_key, user, project, filename) -> List[ChunkedUpload]:
+    """Chunks of an upload, from memory, the on-disk manifest, or legacy DB rows"""
+    upload_info = await upload_state.get(upload_key)
+    records = upload_info['records'] if upload_info else []
+    if not upload_info or len(records) < upload_info['total_chunks']:
+        # State started over after a restart may hold only the chunks sent since, merge in the manifest
+        loop = asyncio.get_event_loop()
+        merged = {record['chunk_number']: record for record in
+                  await loop.run_in_executor(io_executor, read_manifest, get_manifest_path(upload_key))}
+        merged.update((record['chunk_number'], record) for record in records)
+        records = list(merged.values())
+    
+    if not records:
+        return await get_chunks_for_upload(user, project, filename)
+    
+    # Unsaved instances, only used for their fields
+    chunks = [ChunkedUpload(filename=filename, **record) for record in records]
+    chunks.sort(key=lambda chunk: chunk.chunk_number)
+    return chunks
+
+def unlink_chunk_files(chunk_paths):
+    # Offset-addressed chunks share one part file, so dedupe first
+    for chunk_path in set(chunk_paths):
+        try:
+            os.unlink(chunk_path)
+        except FileNotFoundError:
+            pass
 
 @sync_to_async
 def cleanup_old_uploads():
     old_threshold = timezone.now() - datetime.timedelta(hours=24)
     old_chunks = ChunkedUpload.objects.filter(created_at__lt=old_threshold)
     
-    for chunk in old_chunks:
-        if os.path.exists(chunk.file):
-            try:
-                os.remove(chunk.file)
-            except OSError:
-                pass
+    for chunk in old_chunks.only('id', 'file'):
+        try:
+            os.unlink(chunk.file)
+        except OSError:
+            pass
     
-    deleted_count = old_chunks.count()
-    old_chunks.delete()
+    deleted_count, _ = old_chunks.delete()
     return deleted_count
 
+class VideoJobRetry(Exception):
+    """A video job that failed before touching the stored file, safe to run again"""
+
 def process_video_background(file_obj_id, original_file_path):
     if not VIDEO_PROCESSING_AVAILABLE:
         logger.warning(f"Video processing not available for file {file_obj_id}")
         return
-        
+    
+    from storage.models import File as DjangoFile
+    
+    temp_output_path = None
     try:
-        from storage.models import File as DjangoFile
-        
-        file_obj = DjangoFile.objects.get(id=file_obj_id)
+        try:
+            file_obj = DjangoFile.objects.get(id=file_obj_id)
+        except DjangoFile.DoesNotExist:
+            logger.warning(f"Video file {file_obj_id} was deleted before processing")
+            return
         
         logger.info(f"Starting video processing for file {file_obj.name}")
         
@@ -290,11 +591,12 @@ def process_video_background(file_obj_id, original_file_path):
         
         if processor.is_h264_already():
             logger.info(f"Video {file_obj.name} already in H.264 format")
+            if wants_hls(file_obj.size):
+                build_hls_playlist(file_obj.file.path, file_obj.id)
             return
         
         original_name = file_obj.name
         base_name = os.path.splitext(original_name)[0]
-        original_extension = os.path.splitext(original_name)[1]
         
         final_dir = os.path.dirname(file_obj.file.path)
         final_path = os.path.join(final_dir, original_name)
@@ -302,44 +604,87 @@ def process_video_background(file_obj_id, original_file_path):
         temp_output_path = os.path.join(final_dir, f"{base_name}_converting.mp4")
         
         success, message = processor.process_video(temp_output_path)
-        
-        if success and os.path.exists(temp_output_path):
-            original_size = file_obj.size
-            new_size = os.path.getsize(temp_output_path)
-            size_diff = new_size - original_size
-            
-            if os.path.exists(original_file_path):
-                os.remove(original_file_path)
-            
-            os.rename(temp_output_path, final_path)
-            
-            new_relative_path = os.path.relpath(final_path, settings.MEDIA_ROOT)
-            file_obj.file.name = new_relative_path
-            file_obj.size = new_size
-            file_obj.content_type = 'video/mp4'
-            file_obj.save()
-            
-            if size_diff != 0:
-                file_obj.user.update_storage_used(abs(size_diff), subtract=(size_diff < 0))
-            
-            logger.info(f"Video processing completed for {file_obj.name}. {message}")
-        else:
-            logger.error(f"Video processing failed for {file_obj.name}: {message}")
-            if os.path.exists(temp_output_path):
-                os.remove(temp_output_path)
-            
+        converted = success and os.path.exists(temp_output_path)
     except Exception as e:
         logger.error(f"Video background processing error: {e}", exc_info=True)
-        
-        temp_files = [
-            f for f in os.listdir(os.path.dirname(original_file_path)) 
-            if f.endswith('_converting.mp4')
-        ]
-        for temp_file in temp_files:
+        if temp_output_path:
             try:
-                os.remove(os.path.join(os.path.dirname(original_file_path), temp_file))
-            except:
+                os.unlink(temp_output_path)
+            except FileNotFoundError:
                 pass
+        raise VideoJobRetry(str(e)) from e
+    
+    if not converted:
+        logger.error(f"Video processing failed for {file_obj.name}: {message}")
+        try:
+            os.unlink(temp_output_path)
+        except FileNotFoundError:
+            pass
+        return
+    
+    # Past this point the original is replaced, so failures are logged and never retried
+    try:
+        original_size = file_obj.size
+        new_size = os.path.getsize(temp_output_path)
+        size_diff = new_size - original_size
+        
+        try:
+            os.unlink(original_file_path)
+        except FileNotFoundError:
+            pass
+        
+        os.rename(temp_output_path, final_path)
+        
+        new_relative_path = os.path.relpath(final_path, settings.MEDIA_ROOT)
+        file_obj.file.name = new_relative_path
+        file_obj.size = new_size
+        file_obj.content_type = 'video/mp4'
+        file_obj.save(update_fields=['file', 'size', 'content_type'])
+        
+        if size_diff != 0:
+            User.objects.filter(id=file_obj.user_id).update(
+                storage_used=Greatest(F('storage_used') + size_diff, 0)
+            )
+            invalidate_user_caches(file_obj.user_id)
+        
+        logger.info(f"Video processing completed for {file_obj.name}. {message}")
+        if wants_hls(file_obj.size):
+            build_hls_playlist(file_obj.file.path, file_obj.id)
+    except Exception as e:
+        logger.error(f"Storing converted video for file {file_obj_id} failed: {e}", exc_info=True)
+
+async def video_worker():
+    loop = asyncio.get_event_loop()
+    while True:
+        job = await video_q.get()
+        try:
+            for attempt in range(VIDEO_JOB_RETRIES):
+                try:
+                    await loop.run_in_executor(None, process_video_background, *job)
+                    break
+                except VideoJobRetry:
+                    if attempt + 1 < VIDEO_JOB_RETRIES:
+                        await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    logger.error(f"Video processing failed for file {job[0]}: {e}", exc_info=True)
+                    break
+            else:
+                logger.error(f"Video processing gave up on file {job[0]} after {VIDEO_JOB_RETRIES} attempts")
+        finally:
+            video_q.task_done()
+
+# Users by id, so the chunk POSTs of one upload skip the user SELECT. The token is still
+# verified on every request; saves in this process drop the entry through
+# invalidate_user_caches, changes made by other processes show up within the TTL.
+_USER_CACHE = TTLCache(maxsize=2048, ttl=30) if CACHETOOLS_AVAILABLE else None
+# TTLCache is not thread-safe, and invalidations also arrive from executor threads
+_user_cache_lock = threading.Lock()
+
+if _USER_CACHE is not None:
+    @on_user_cache_invalidated
+    def _drop_cached_user(user_id):
+        with _user_cache_lock:
+            _USER_CACHE.pop(str(user_id), None)
 
 async def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization:
@@ -356,7 +701,16 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
+        if _USER_CACHE is not None:
+            with _user_cache_lock:
+                user = _USER_CACHE.get(str(user_id))
+            if user is not None:
+                return user
+        
         user = await get_user_by_id(user_id)
+        if _USER_CACHE is not None:
+            with _user_cache_lock:
+                _USER_CACHE[str(user_id)] = user
         return user
     except InvalidToken:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -364,127 +718,269 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         logger.error(f"Authentication error: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def sweep_temp_files(temp_dir: str) -> List[str]:
+    current_time = time.time()
+    removed = []
+    try:
+        entries = os.scandir(temp_dir)
+    except FileNotFoundError:
+        return removed
+    
+    with entries:
+        for entry in entries:
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if current_time - entry.stat().st_ctime > TEMP_CLEANUP_INTERVAL:
+                    os.unlink(entry.path)
+                    removed.append(entry.name)
+            except OSError:
+                pass
+    return removed
+
 async def cleanup_temp_files():
-    temp_dir = os.path.join(settings.MEDIA_ROOT, 'uploads', 'chunks')
-    if not os.path.exists(temp_dir):
-        return
+    # Whole sweep runs in one executor hop so the event loop never blocks on stat
+    loop = asyncio.get_event_loop()
+    removed = await loop.run_in_executor(io_executor, sweep_temp_files, _CHUNKS_BASE)
+    for filename in removed:
+        logger.info(f"Cleaned up old temp file: {filename}")
+
+def pwrite_all(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+def hash_and_pwrite(fd: int, data: bytes, offset: int, hasher=None):
+    # One pass over the buffer while it is still in cache
+    if hasher is not None:
+        hasher.update(data)
+    pwrite_all(fd, data, offset)
+
+def blake3_file_region(path: str, offset: int, length: int) -> str:
+    """BLAKE3 hex digest of length bytes at offset, hashed from an mmap with all cores"""
+    hasher = blake3(max_threads=blake3.AUTO)
+    if length == 0:
+        return hasher.hexdigest()
     
-    current_time = time.time()
-    for filename in os.listdir(temp_dir):
-        filepath = os.path.join(temp_dir, filename)
-        if os.path.isfile(filepath):
-            file_age = current_time - os.path.getctime(filepath)
-            if file_age > TEMP_CLEANUP_INTERVAL:
-                try:
-                    os.remove(filepath)
-                    logger.info(f"Cleaned up old temp file: {filename}")
-                except OSError:
-                    pass
+    # mmap offsets must be aligned to the allocation granularity
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), length + offset - start, access=mmap.ACCESS_READ, offset=start) as mm:
+            view = memoryview(mm)
+            try:
+                hasher.update(view[offset - start:])
+            finally:
+                view.release()
+    return hasher.hexdigest()
+
+def copy_file_at(chunk_path: str, out_fd: int, dst_offset: int) -> int:
+    """Copy a chunk file into out_fd at dst_offset, return bytes copied"""
+    with open(chunk_path, 'rb') as chunk_file:
+        in_fd = chunk_file.fileno()
+        size = os.fstat(in_fd).st_size
+        copied = 0
+        # Explicit offsets on both sides, so several chunks can copy in parallel
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(in_fd, out_fd, size - copied, copied, dst_offset + copied)
+                    if n == 0:
+                        break
+                    copied += n
+            except OSError:
+                # e.g. EXDEV/EINVAL on older kernels, continue with pread/pwrite
+                pass
+        while copied < size:
+            buffer = os.pread(in_fd, min(WRITE_BATCH, size - copied), copied)
+            if not buffer:
+                break
+            pwrite_all(out_fd, buffer, dst_offset + copied)
+            copied += len(buffer)
+    return copied
+
+def fast_move(src: str, dst: str):
+    """Move src to dst, copying in-kernel when they are on different filesystems"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Cross-device: copy_file_range next to dst, then rename so dst never shows a partial file
+    moving_path = f"{dst}.moving"
+    fd = os.open(moving_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        copy_file_at(src, fd, 0)
+    except BaseException:
+        os.close(fd)
+        os.unlink(moving_path)
+        raise
+    os.close(fd)
+    os.replace(moving_path, dst)
+    os.unlink(src)
 
+@functools.lru_cache(maxsize=4096)
 def get_upload_key(user_id: str, project_id: str, filename: str) -> str:
-    return hashlib.md5(f"{user_id}_{project_id}_{filename}".encode()).hexdigest()[:16]
+    # Non-cryptographic key, only used for dict lookups and chunk filenames
+    key = f"{user_id}_{project_id}_{filename}".encode()
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_64_hexdigest(key)
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+def prune_made_dirs():
+    stale = {d for d in _MADE_DIRS if not os.path.isdir(d)}
+    _MADE_DIRS.difference_update(stale)
 
 async def periodic_cleanup():
+    loop = asyncio.get_event_loop()
+    # Wake-ups are pinned to a monotonic grid, so slow sweeps don't push the cadence back
+    next_wake = loop.time()
     while True:
         try:
             deleted = await cleanup_old_uploads()
             if deleted > 0:
                 logger.info(f"Cleaned up {deleted} old chunk uploads")
             await cleanup_temp_files()
+            prune_made_dirs()
+            upload_state.expire()
+            expire_upload_locks()
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
         
-        await asyncio.sleep(3600)
+        next_wake += CLEANUP_PERIOD
+        now = loop.time()
+        if next_wake < now:
+            # Fell more than a period behind (e.g. suspended), skip the missed runs
+            next_wake = now
+        await asyncio.sleep(next_wake - now)
 
 @router.post("/upload/chunk/")
 async def upload_chunk(
+    request: Request,
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    filename: str = Form(...),
-    chunk_number: int = Form(...),
-    total_chunks: int = Form(...),
-    total_size: int = Form(...),
-    project_id: str = Form(...),
-    folder_id: Optional[str] = Form(None),
     current_user = Depends(get_current_user)
 ):
+    staging_path = f"{_CHUNKS_BASE}/.incoming_{uuid.uuid4().hex}"
+    chunk_number = None
     try:
+        ensure_dir(_CHUNKS_BASE)
+        receiver = ChunkFormReceiver(staging_path)
+        await receiver.receive(request)
+        if not receiver.has_file:
+            raise HTTPException(status_code=422, detail="Missing file part")
+        
+        try:
+            data = ChunkUploadRequest(**receiver.fields)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        
+        filename = data.filename
+        chunk_number = data.chunk_number
+        total_chunks = data.total_chunks
+        total_size = data.total_size
+        project_id = data.project_id
+        folder_id = data.folder_id
+        chunk_offset = data.chunk_offset
+        chunk_hash = data.chunk_hash
+        bytes_written = receiver.bytes_written
+        
+        if receiver.hasher is not None and receiver.hasher.hexdigest() != chunk_hash.lower():
+            raise HTTPException(status_code=400, detail=f"Chunk {chunk_number} hash mismatch")
+        
+        if not 0 <= chunk_number < total_chunks:
+            raise HTTPException(status_code=400, detail=f"Chunk number {chunk_number} out of range")
+        if chunk_offset is not None:
+            # Every chunk but the last has the same length, so its offset follows from its
+            # number; the last one ends exactly at total_size
+            if chunk_number == total_chunks - 1:
+                expected_offset = total_size - bytes_written
+            else:
+                expected_offset = chunk_number * bytes_written
+            if chunk_offset != expected_offset or chunk_offset < 0 or chunk_offset + bytes_written > total_size:
+                raise HTTPException(status_code=400, detail=f"Chunk {chunk_number} offset {chunk_offset} does not fit the upload")
+        
         logger.info(f"Uploading chunk {chunk_number}/{total_chunks} for file {filename}")
         
         if folder_id == "":
             folder_id = None
             
-        if not await check_user_storage_space(current_user, total_size):
+        if not current_user.has_storage_space(total_size):
             raise HTTPException(status_code=400, detail="Not enough storage space")
         
-        try:
-            project = await get_project_by_id(project_id, current_user)
-        except Exception as e:
-            raise HTTPException(status_code=404, detail=f"Project not found: {str(e)}")
-        
-        folder = None
-        if folder_id:
-            try:
-                folder = await get_folder_by_id(folder_id, current_user)
-                if str(folder.project.id) != project_id:
-                    raise HTTPException(status_code=400, detail="Folder does not belong to specified project")
-            except Exception as e:
-                raise HTTPException(status_code=404, detail=f"Folder not found: {str(e)}")
+        project, folder = await get_project_and_folder(project_id, folder_id, current_user)
         
         upload_key = get_upload_key(str(current_user.id), project_id, filename)
         
+        manifest_path = get_manifest_path(upload_key)
+        upload_lock = get_upload_lock(upload_key)
         if chunk_number == 0:
-            await cleanup_existing_chunks(current_user, project, filename)
-            if upload_key in active_uploads:
-                del active_uploads[upload_key]
-        
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'uploads', 'chunks')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        chunk_filename = f"{upload_key}_c{chunk_number:03d}"
-        temp_file_path = os.path.join(temp_dir, chunk_filename)
+            async with upload_lock:
+                await cleanup_existing_chunks(current_user, project, filename)
+                await upload_state.discard(upload_key)
+                # The part file of an abandoned upload would otherwise keep its old bytes and length
+                for stale_path in (manifest_path, f"{_CHUNKS_BASE}/{upload_key}{PART_SUFFIX}"):
+                    try:
+                        os.unlink(stale_path)
+                    except FileNotFoundError:
+                        pass
         
-        bytes_written = 0
-        async with aiofiles.open(temp_file_path, 'wb') as out_file:
-            while True:
-                chunk_data = await file.read(1024 * 1024)
-                if not chunk_data:
-                    break
-                await out_file.write(chunk_data)
-                bytes_written += len(chunk_data)
-        
-        if upload_key not in active_uploads:
-            active_uploads[upload_key] = {
-                'chunks_received': set(),
-                'total_chunks': total_chunks,
-                'total_size': total_size,
-                'project_id': project_id,
-                'folder_id': folder_id,
-                'user_id': str(current_user.id),
-                'filename': filename
-            }
-        
-        active_uploads[upload_key]['chunks_received'].add(chunk_number)
+        loop = asyncio.get_event_loop()
+        if chunk_offset is None:
+            # The staged body already is the chunk file, renaming it is free
+            temp_file_path = f"{_CHUNKS_BASE}/{upload_key}_c{chunk_number:03d}"
+            os.replace(staging_path, temp_file_path)
+        else:
+            # Client sent the byte offset, place the chunk in the shared part file
+            temp_file_path = f"{_CHUNKS_BASE}/{upload_key}{PART_SUFFIX}"
+            fd = os.open(temp_file_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                if chunk_number == 0 and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(fd, 0, total_size)
+                    except OSError:
+                        pass
+                await loop.run_in_executor(io_executor, copy_file_at, staging_path, fd, chunk_offset)
+            finally:
+                os.close(fd)
         
-        chunk_record = await create_or_update_chunked_upload_record(
-            temp_file_path,
-            filename,
-            file.content_type or 'application/octet-stream',
-            chunk_number,
-            total_chunks,
-            total_size,
-            current_user,
-            project,
-            folder
-        )
+        # Hashed while streaming already, or the field came after the file part
+        if chunk_hash and receiver.hasher is None:
+            if BLAKE3_AVAILABLE:
+                chunk_start = chunk_offset or 0
+                actual_hash = await loop.run_in_executor(
+                    io_executor, blake3_file_region, temp_file_path, chunk_start, bytes_written
+                )
+                if actual_hash != chunk_hash.lower():
+                    if chunk_offset is None:
+                        os.unlink(temp_file_path)
+                    raise HTTPException(status_code=400, detail=f"Chunk {chunk_number} hash mismatch")
+            else:
+                logger.warning("chunk_hash sent but blake3 is not installed, skipping verification")
         
-        chunks_received = len(active_uploads[upload_key]['chunks_received'])
-        is_complete = chunks_received == total_chunks
+        # Chunk metadata stays out of the DB, the manifest only covers restarts
+        chunk_record = {
+            'id': str(uuid.uuid4()),
+            'file': temp_file_path,
+            'content_type': receiver.file_content_type or 'application/octet-stream',
+            'chunk_number': chunk_number,
+            'total_chunks': total_chunks,
+            'total_size': total_size
+        }
+        async with upload_lock:
+            if chunk_number != 0 and await upload_state.get(upload_key) is None:
+                # State was lost with a restart, pick up the chunks sent before it from the manifest
+                for record in await loop.run_in_executor(io_executor, read_manifest, manifest_path):
+                    await upload_state.add_chunk(upload_key, record, total_chunks)
+            chunks_received = await upload_state.add_chunk(upload_key, chunk_record, total_chunks)
+            await loop.run_in_executor(io_executor, append_manifest, manifest_path, chunk_record)
+            is_complete = chunks_received == total_chunks
         
         response = {
             "status": "success" if not is_complete else "ready_to_merge",
             "message": f"Chunk {chunk_number + 1}/{total_chunks} uploaded successfully",
-            "chunk_id": str(chunk_record.id),
+            "chunk_id": chunk_record['id'],
             "chunks_received": chunks_received,
             "total_chunks": total_chunks,
             "bytes_written": bytes_written,
@@ -496,13 +992,18 @@ async def upload_chunk(
             response["message"] = "All chunks uploaded, ready to complete"
             background_tasks.add_task(cleanup_temp_files)
         
-        return JSONResponse(content=response)
+        return APIResponse(content=response)
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error uploading chunk {chunk_number}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error uploading chunk: {str(e)}")
+    finally:
+        try:
+            os.unlink(staging_path)
+        except FileNotFoundError:
+            pass
 
 @router.post("/upload/complete/")
 async def complete_upload(
@@ -516,77 +1017,94 @@ async def complete_upload(
         folder_id = data.folder_id
         upload_key = get_upload_key(str(current_user.id), project_id, filename)
         
-        try:
-            project = await get_project_by_id(project_id, current_user)
-        except Exception:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        folder = None
-        if folder_id:
-            try:
-                folder = await get_folder_by_id(folder_id, current_user)
-                if str(folder.project.id) != project_id:
-                    raise HTTPException(status_code=400, detail="Folder does not belong to specified project")
-            except Exception:
-                raise HTTPException(status_code=404, detail="Folder not found")
+        project, folder = await get_project_and_folder(project_id, folder_id, current_user)
         
-        chunks = await get_chunks_for_upload(current_user, project, filename)
+        chunks = await load_upload_chunks(upload_key, current_user, project, filename)
         
         if not chunks:
             raise HTTPException(status_code=400, detail="No chunks found")
         
         total_chunks = chunks[0].total_chunks
         if len(chunks) != total_chunks:
-            return JSONResponse(content={
+            return APIResponse(content={
                 "error": "Not all chunks are uploaded yet",
                 "uploaded": len(chunks),
                 "total": total_chunks
             }, status_code=400)
         
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
+        project_name = project.name.replace(' ', '_').replace('/', '_').lower()
+        safe_filename = "".join(c for c in filename if c.isalnum() or c in '.-_')
+        
+        if folder:
+            folder_path = folder.path.replace(' ', '_').replace('/', '_').lower()
+            relative_path = f"user_{current_user.id}/{project_name}/{folder_path}/{safe_filename}"
+        else:
+            relative_path = f"user_{current_user.id}/{project_name}/{safe_filename}"
+        
+        final_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+        file_dir = os.path.dirname(final_file_path)
+        os.makedirs(file_dir, exist_ok=True)
         
-        with tempfile.NamedTemporaryFile(delete=False, dir=temp_dir) as temp_merged:
-            merged_file_path = temp_merged.name
+        # Chunks sent with an offset already form the whole file, no merge pass needed
+        in_place = chunks[0].file.endswith(PART_SUFFIX)
+        
+        if in_place:
+            merged_file_path = chunks[0].file
+        else:
+            # Merge next to the final path so the move below is a plain rename
+            with tempfile.NamedTemporaryFile(delete=False, dir=file_dir, prefix='.merging_') as temp_merged:
+                merged_file_path = temp_merged.name
         
         total_bytes_written = 0
+        loop = asyncio.get_event_loop()
         
         try:
-            with open(merged_file_path, 'wb') as merged_file:
+            if in_place:
+                try:
+                    with open(merged_file_path, 'rb+') as merged_file:
+                        os.fsync(merged_file.fileno())
+                        total_bytes_written = os.fstat(merged_file.fileno()).st_size
+                except FileNotFoundError:
+                    raise HTTPException(status_code=500, detail="Upload data missing")
+                if total_bytes_written != chunks[0].total_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Upload size {total_bytes_written} does not match the declared {chunks[0].total_size} bytes"
+                    )
+            else:
+                chunk_offsets = []
+                merged_size = 0
                 for chunk in chunks:
-                    chunk_path = chunk.file
-                    if not os.path.exists(chunk_path):
+                    try:
+                        chunk_size = os.path.getsize(chunk.file)
+                    except FileNotFoundError:
                         raise HTTPException(status_code=500, detail=f"Chunk file missing: {chunk.chunk_number}")
+                    chunk_offsets.append(merged_size)
+                    merged_size += chunk_size
+                
+                with open(merged_file_path, 'wb') as merged_file:
+                    out_fd = merged_file.fileno()
+                    if hasattr(os, 'posix_fallocate') and merged_size:
+                        try:
+                            os.posix_fallocate(out_fd, 0, merged_size)
+                        except OSError:
+                            pass
                     
-                    with open(chunk_path, 'rb') as chunk_file:
-                        while True:
-                            buffer = chunk_file.read(1024 * 1024)
-                            if not buffer:
-                                break
-                            merged_file.write(buffer)
-                            total_bytes_written += len(buffer)
+                    # Every chunk knows its offset up front, copy them concurrently on the I/O pool
+                    copied = await asyncio.gather(*(
+                        loop.run_in_executor(io_executor, copy_file_at, chunk.file, out_fd, offset)
+                        for chunk, offset in zip(chunks, chunk_offsets)
+                    ))
+                    total_bytes_written = sum(copied)
+                    os.ftruncate(out_fd, total_bytes_written)
             
             final_content_type = detect_content_type(filename)
             is_video = final_content_type.startswith('video/')
             
-            project_name = project.name.replace(' ', '_').replace('/', '_').lower()
-            safe_filename = "".join(c for c in filename if c.isalnum() or c in '.-_')
-            
-            if folder:
-                folder_path = folder.path.replace(' ', '_').replace('/', '_').lower()
-                relative_path = f"user_{current_user.id}/{project_name}/{folder_path}/{safe_filename}"
-            else:
-                relative_path = f"user_{current_user.id}/{project_name}/{safe_filename}"
-            
-            final_file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-            file_dir = os.path.dirname(final_file_path)
-            os.makedirs(file_dir, exist_ok=True)
-            
             if is_video and VIDEO_PROCESSING_AVAILABLE:
                 logger.info(f"Processing video file: {filename}")
                 
-                import shutil
-                shutil.move(merged_file_path, final_file_path)
+                await loop.run_in_executor(io_executor, fast_move, merged_file_path, final_file_path)
                 
                 file_obj = await create_final_file_with_video_processing(
                     filename,
@@ -600,13 +1118,7 @@ async def complete_upload(
                 
                 await update_user_storage(current_user, file_obj.size)
                 
-                loop = asyncio.get_event_loop()
-                loop.run_in_executor(
-                    video_processing_executor,
-                    process_video_background,
-                    str(file_obj.id),
-                    final_file_path
-                )
+                await video_q.put((str(file_obj.id), final_file_path))
                 
                 response_data = {
                     "id": str(file_obj.id),
@@ -625,8 +1137,7 @@ async def complete_upload(
                     "message": "Video uploaded successfully. Converting to H.264 in background..."
                 }
             else:
-                import shutil
-                shutil.move(merged_file_path, final_file_path)
+                await loop.run_in_executor(io_executor, fast_move, merged_file_path, final_file_path)
                 
                 file_obj = await create_final_file_with_video_processing(
                     filename,
@@ -659,20 +1170,22 @@ async def complete_upload(
                 if is_video and not VIDEO_PROCESSING_AVAILABLE:
                     response_data["message"] = "Video uploaded but processing unavailable. Install ffmpeg for H.264 conversion."
             
-            for chunk in chunks:
-                chunk_path = chunk.file
-                if os.path.exists(chunk_path):
-                    os.remove(chunk_path)
-                await delete_chunk(chunk)
-            
-            if upload_key in active_uploads:
-                del active_uploads[upload_key]
+            loop = asyncio.get_event_loop()
+            chunk_paths = [chunk.file for chunk in chunks] + [get_manifest_path(upload_key)]
+            await loop.run_in_executor(io_executor, unlink_chunk_files, chunk_paths)
+            await delete_chunks_for_upload(current_user, project, filename)
+            await upload_state.discard(upload_key)
+            drop_upload_lock(upload_key)
             
-            return JSONResponse(content=response_data)
+            return APIResponse(content=response_data)
         
         except Exception as e:
-            if os.path.exists(merged_file_path):
-                os.remove(merged_file_path)
+            # Keep an in-place part file so the client can retry completion
+            if not in_place:
+                try:
+                    os.unlink(merged_file_path)
+                except FileNotFoundError:
+                    pass
             raise e
     
     except Exception as e:
@@ -692,12 +1205,13 @@ async def get_upload_status(
     except Exception:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if upload_key not in active_uploads:
-        chunks = await filter_chunks_by_upload(current_user, project, filename)
+    upload_info = await upload_state.get(upload_key)
+    if upload_info is None:
+        chunks = await load_upload_chunks(upload_key, current_user, project, filename)
         if not chunks:
             raise HTTPException(status_code=404, detail="Upload not found")
         
-        return JSONResponse(content={
+        return APIResponse(content={
             "status": "unknown",
             "chunks_received": len(chunks),
             "total_chunks": chunks[0].total_chunks if chunks else 0,
@@ -705,12 +1219,12 @@ async def get_upload_status(
             "filename": filename
         })
     
-    upload_info = active_uploads[upload_key]
-    return JSONResponse(content={
+    chunks_received = len(upload_info['records'])
+    return APIResponse(content={
         "status": "in_progress",
-        "chunks_received": len(upload_info['chunks_received']),
+        "chunks_received": chunks_received,
         "total_chunks": upload_info['total_chunks'],
-        "progress_percent": (len(upload_info['chunks_received']) / upload_info['total_chunks']) * 100,
+        "progress_percent": (chunks_received / upload_info['total_chunks']) * 100,
         "project_id": project_id,
         "filename": filename
     })
@@ -728,16 +1242,15 @@ async def cancel_upload(
     except Exception:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    chunks = await get_chunks_for_upload(current_user, project, filename)
-    for chunk in chunks:
-        if os.path.exists(chunk.file):
-            os.remove(chunk.file)
-        await delete_chunk(chunk)
-    
-    if upload_key in active_uploads:
-        del active_uploads[upload_key]
+    chunks = await load_upload_chunks(upload_key, current_user, project, filename)
+    loop = asyncio.get_event_loop()
+    chunk_paths = [chunk.file for chunk in chunks] + [get_manifest_path(upload_key)]
+    await loop.run_in_executor(io_executor, unlink_chunk_files, chunk_paths)
+    await delete_chunks_for_upload(current_user, project, filename)
+    await upload_state.discard(upload_key)
+    drop_upload_lock(upload_key)
     
-    return JSONResponse(content={
+    return APIResponse(content={
         "message": "Upload cancelled successfully",
         "project_id": project_id,
         "filename": filename
@@ -765,7 +1278,7 @@ async def get_video_processing_status(
             processing_file = f"{file_obj.file.path}_processing"
             is_processing = os.path.exists(processing_file)
         
-        return JSONResponse(content={
+        return APIResponse(content={
             "file_id": file_id,
             "processing": is_processing,
             "content_type": file_obj.content_type,
@@ -777,20 +1290,29 @@ async def get_video_processing_status(
     except Exception as e:
         raise HTTPException(status_code=404, detail="File not found")
 
+async def read_gpu_status():
+    """(gpu_info, should_use_gpu, reason), answered within GPU_QUERY_TIMEOUT even if nvidia-smi stalls"""
+    try:
+        gpu_info = await asyncio.wait_for(asyncio.to_thread(GPUMonitor.get_nvidia_gpu_usage), GPU_QUERY_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"GPU query did not answer within {GPU_QUERY_TIMEOUT}s, treating GPU as unavailable")
+        return None, False, f"GPU query timed out after {GPU_QUERY_TIMEOUT}s"
+    should_use_gpu, reason = GPUMonitor.should_use_gpu(gpu_info=gpu_info)
+    return gpu_info, should_use_gpu, reason
+
 # Test endpoint để check GPU status
 @router.get("/gpu/status")
 async def get_gpu_status():
     """Endpoint để kiểm tra trạng thái GPU"""
     if not VIDEO_PROCESSING_AVAILABLE:
-        return JSONResponse(content={
+        return APIResponse(content={
             "video_processing_available": False,
             "error": "Video processing module not available"
         })
     
-    gpu_info = GPUMonitor.get_nvidia_gpu_usage()
-    should_use_gpu, reason = GPUMonitor.should_use_gpu()
+    gpu_info, should_use_gpu, reason = await read_gpu_status()
     
-    return JSONResponse(content={
+    return APIResponse(content={
         "video_processing_available": True,
         "gpu_available": gpu_info is not None,
         "should_use_gpu": should_use_gpu,
@@ -806,7 +1328,7 @@ async def test_video_processing(
 ):
     """Test endpoint để kiểm tra video processing"""
     if not VIDEO_PROCESSING_AVAILABLE:
-        return JSONResponse(content={
+        return APIResponse(content={
             "error": "Video processing not available",
             "suggestion": "Install ffmpeg and create video_processing module"
         })
@@ -814,36 +1336,34 @@ async def test_video_processing(
     # Kiểm tra file có phải video không
     content_type = detect_content_type(file.filename or "")
     if not content_type.startswith('video/'):
-        return JSONResponse(content={
+        return APIResponse(content={
             "error": "File is not a video",
             "detected_type": content_type
         })
     
     # Lưu file tạm để test
-    temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp', 'test')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    temp_file_path = os.path.join(temp_dir, f"test_{int(time.time())}_{file.filename}")
+    ensure_dir(_TEST_TEMP_DIR)
+    temp_file_path = f"{_TEST_TEMP_DIR}/test_{int(time.time())}_{file.filename}"
     
     try:
         # Lưu file upload
         async with aiofiles.open(temp_file_path, 'wb') as f:
             while True:
-                chunk = await file.read(1024 * 1024)
+                chunk = await file.read(READ_SLICE)
                 if not chunk:
                     break
                 await f.write(chunk)
         
         # Test video processing
         processor = VideoProcessor(temp_file_path)
-        video_info = processor.get_video_info()
-        is_h264 = processor.is_h264_already()
-        width, height = processor.get_video_resolution()
-        estimated_vram = processor.estimate_vram_usage()
+        probe = processor.probe_all()
+        video_info = probe['info']
+        is_h264 = probe['is_h264']
+        width, height = probe['w'], probe['h']
+        estimated_vram = probe['vram']
         
         # Check GPU status
-        should_use_gpu, gpu_reason = GPUMonitor.should_use_gpu()
-        gpu_info = GPUMonitor.get_nvidia_gpu_usage()
+        gpu_info, should_use_gpu, gpu_reason = await read_gpu_status()
         
         result = {
             "file_info": {
@@ -865,16 +1385,18 @@ async def test_video_processing(
             "processing_recommendation": "no_conversion_needed" if is_h264 else ("gpu_encoding" if should_use_gpu else "cpu_encoding")
         }
         
-        return JSONResponse(content=result)
+        return APIResponse(content=result)
         
     except Exception as e:
-        return JSONResponse(content={
+        return APIResponse(content={
             "error": f"Test failed: {str(e)}"
         })
     finally:
         # Cleanup
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        try:
+            os.unlink(temp_file_path)
+        except FileNotFoundError:
+            pass
 
 # Network and chunk size optimization endpoints
 @router.get("/network/test")
@@ -921,6 +1443,7 @@ async def get_upload_config(
         "chunk_size_bytes": chunk_size_bytes,
         "chunk_size_mb": chunk_size_bytes / (1024 * 1024),
         "concurrent_chunks": network_config['concurrent_chunks'],
+        "max_parallel_chunks": min(network_config['concurrent_chunks'], MAX_PARALLEL_CHUNKS),
         "retry_attempts": network_config['retry_attempts'],
         "timeout_seconds": network_config['timeout'],
         "total_chunks": total_chunks,
@@ -998,14 +1521,14 @@ async def upload_chunk(
     filename: str = Form(...),
     project_id: Optional[str] = Form(None),
     folder_id: Optional[str] = Form(None),
-    chunk_size_name: str = Form('large'),  # Dynamic chunk size
+    chunk_size_name: ChunkSizeName = Form('large'),  # Dynamic chunk size
     authorization: str = Header(None)
 ):
     """Upload a file chunk with dynamic chunk size support"""
     user = await get_current_user(authorization)
     
-    # Get chunk size configuration
-    expected_chunk_size = get_chunk_size(chunk_size_name)
+    # Get chunk size configuration (name already validated by FastAPI)
+    expected_chunk_size = settings.CHUNK_SIZE_OPTIONS[chunk_size_name]
     
     # Validate chunk size
     if file.size and file.size > expected_chunk_size * 1.1:  # Allow 10% tolerance
@@ -1016,12 +1539,11 @@ async def upload_chunk(
     
     try:
         # Create chunk directory with chunk size info
-        chunk_dir = os.path.join(settings.MEDIA_ROOT, 'uploads', 'chunks', f"{user.id}_{filename}_{chunk_size_name}")
-        os.makedirs(chunk_dir, exist_ok=True)
+        chunk_dir = f"{_CHUNKS_BASE}/{user.id}_{filename}_{chunk_size_name}"
+        ensure_dir(chunk_dir)
         
         # Save chunk with size info in filename
-        chunk_filename = f"chunk_{chunk_number}_{chunk_size_name}"
-        chunk_path = os.path.join(chunk_dir, chunk_filename)
+        chunk_path = f"{chunk_dir}/chunk_{chunk_number}_{chunk_size_name}"
         
         with open(chunk_path, "wb") as chunk_file:
             content = await file.read()
@@ -1043,26 +1565,44 @@ async def upload_chunk(
 # Include all routes
 app.include_router(router, prefix="/api")
 
+async def _log_gpu():
+    # nvidia-smi is a blocking subprocess, keep it off the event loop
+    try:
+        gpu_info = await asyncio.wait_for(asyncio.to_thread(GPUMonitor.get_gpu_static_info), GPU_QUERY_TIMEOUT)
+        if gpu_info:
+            GPUMonitor.start_sampler()
+            logger.info(f"NVIDIA GPU detected: {gpu_info['gpu_count']} GPU(s)")
+            for i, gpu in enumerate(gpu_info['gpus']):
+                logger.info(f"GPU {i}: {gpu['name']} - driver {gpu['driver_version']}, {gpu['memory_total_mb']} MB VRAM")
+        else:
+            logger.info("No NVIDIA GPU detected or nvidia-smi not available")
+    except asyncio.TimeoutError:
+        logger.warning(f"GPU detection did not finish within {GPU_QUERY_TIMEOUT}s, continuing without GPU info")
+    except Exception as e:
+        logger.warning(f"GPU detection failed: {e}")
+
+# Strong refs to startup tasks, the loop itself only keeps weak ones
+_background_tasks: set = set()
+
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(periodic_cleanup())
+    _background_tasks.add(asyncio.create_task(periodic_cleanup()))
     
     # Log video processing availability
     if VIDEO_PROCESSING_AVAILABLE:
         logger.info("Video processing module loaded successfully")
-        try:
-            gpu_info = GPUMonitor.get_nvidia_gpu_usage()
-            if gpu_info:
-                logger.info(f"NVIDIA GPU detected: {len(gpu_info['gpus'])} GPU(s)")
-                for i, gpu in enumerate(gpu_info['gpus']):
-                    logger.info(f"GPU {i}: {gpu['name']} - {gpu['gpu_utilization']}% utilization, {gpu['memory_usage_percent']:.1f}% VRAM")
-            else:
-                logger.info("No NVIDIA GPU detected or nvidia-smi not available")
-        except Exception as e:
-            logger.warning(f"GPU detection failed: {e}")
+        _background_tasks.add(asyncio.create_task(video_worker()))
+        gpu_task = asyncio.create_task(_log_gpu())
+        _background_tasks.add(gpu_task)
+        gpu_task.add_done_callback(_background_tasks.discard)
     else:
         logger.warning("Video processing module not available. Videos will be stored without H.264 conversion.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if VIDEO_PROCESSING_AVAILABLE:
+        GPUMonitor.stop_sampler()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
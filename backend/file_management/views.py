@@ -1,29 +1,245 @@
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse, Http404
-from django.db import transaction
-from django.core.paginator import Paginator
-from storage.models import File as DjangoFile, Folder, Project
-from storage.serializers import FileSerializer, FolderSerializer, ProjectSerializer
+from django.http import Http404
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.core.paginator import EmptyPage, Paginator
+from django.utils.functional import cached_property
+from storage.models import File as DjangoFile, Folder, Project, annotate_project_stats, content_kind_breakdown, folder_ancestry, mark_for_cleanup
+from storage.serializers import FileSerializer, ProjectSerializer
+from users.models import projects_list_cache_key, shared_cache, storage_stats_cache_key
+from core.downloads import file_download_response
 import os
+import json
+import uuid
+import base64
+from datetime import datetime
 import stat
 import time
 import logging
 import subprocess
 import signal
 import psutil
-import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
 
 logger = logging.getLogger(__name__)
 
+# Threads used to unlink files in bulk_delete and to run the slow deletion fallbacks
+BULK_DELETE_WORKERS = 8
+_deletion_executor = ThreadPoolExecutor(max_workers=BULK_DELETE_WORKERS, thread_name_prefix="file_delete")
+
+# Independent fallbacks (chmod, sudo, move) are raced on their own small pool, so a
+# fallback never waits on a bulk_delete worker. Seconds to wait for the first success.
+FALLBACK_RACE_TIMEOUT = 5
+_fallback_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="file_delete_fallback")
+# Paths a fallback chain is currently working on, so one file never gets two chains
+_force_delete_paths = set()
+_force_delete_lock = threading.Lock()
+
+_SIZE_UNITS = ("Bytes", "KB", "MB", "GB", "TB")
+
+
+def format_file_size(bytes_size):
+    if bytes_size == 0:
+        return "0 Bytes"
+    # Each unit is 10 more bits, so the bit length picks the unit without a loop
+    i = min((int(bytes_size).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if bytes_size >= 1024 else 0
+    return f"{bytes_size / (1 << (10 * i)):.2f} {_SIZE_UNITS[i]}"
+
+def listing_row(row):
+    # Module level so the listing loops skip the bound-method lookup per row
+    project_name = row['project__name'] or 'No Project'
+    if row['folder_id']:
+        file_path = f"{project_name}/{row['folder__path']}/{row['name']}"
+    else:
+        file_path = f"{project_name}/{row['name']}"
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'size': row['size'],
+        'content_type': row['content_type'],
+        'project': str(row['project_id']) if row['project_id'] else None,
+        'project_name': row['project__name'],
+        'folder': str(row['folder_id']) if row['folder_id'] else None,
+        'folder_name': row['folder__name'],
+        'uploaded_at': row['uploaded_at'].isoformat(),
+        'size_formatted': format_file_size(row['size']),
+        'file_path': file_path
+    }
+
+def encode_cursor(row):
+    # Opaque keyset cursor: the (uploaded_at, id) of the last row on the page
+    return base64.urlsafe_b64encode(f"{row['uploaded_at'].isoformat()}|{row['id']}".encode()).decode()
+
+def decode_cursor(cursor):
+    """(uploaded_at, id) from encode_cursor, ValueError when the cursor is malformed"""
+    uploaded_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(uploaded_at), uuid.UUID(pk)
+
+def keyset_page(queryset, cursor, page_size):
+    """Rows after cursor, newest first, and the cursor of the next page (None on the last page).
+
+    Seeks on (uploaded_at, id) instead of OFFSET, so deep pages cost the same as the first
+    and no COUNT(*) is needed.
+    """
+    if cursor:
+        uploaded_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk))
+    rows = list(queryset.order_by('-uploaded_at', '-id')[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+# Same file URL and datetime rendering as the serializers' FileField/DateTimeField
+_file_storage = DjangoFile._meta.get_field('file').storage
+_render_datetime = serializers.DateTimeField().to_representation
+
+def annotate_folder_counts(queryset):
+    """Attach files_count and subfolders_count (direct children) to each folder in the same query"""
+    folder_files = DjangoFile.objects.filter(folder=OuterRef('pk')).order_by().values('folder')
+    subfolders = Folder.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+    return queryset.annotate(
+        files_count=Coalesce(Subquery(folder_files.annotate(n=Count('id')).values('n')), 0),
+        subfolders_count=Coalesce(Subquery(subfolders.annotate(n=Count('id')).values('n')), 0),
+    )
+
+def root_file_row(row, project_name):
+    # FileSerializer's output for a file outside any folder, built from a .values() row
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'file': _file_storage.url(row['file']) if row['file'] else None,
+        'size': row['size'],
+        'content_type': row['content_type'],
+        'folder': None,
+        'project': str(row['project_id']),
+        'file_path': f"{project_name}/{row['name']}",
+        'uploaded_at': _render_datetime(row['uploaded_at'])
+    }
+
+def root_folder_row(row, project_name):
+    # FolderSerializer's output for a top-level folder, built from an annotate_folder_counts row
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'path': row['path'],
+        'parent': None,
+        'project': str(row['project_id']),
+        'files_count': row['files_count'],
+        'subfolders_count': row['subfolders_count'],
+        'full_path': f"{project_name}/{row['path']}",
+        'created_at': _render_datetime(row['created_at']),
+        'updated_at': _render_datetime(row['updated_at'])
+    }
+
+def project_row(row):
+    # by_project/projects_list entry for an annotate_project_stats .values() row
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'description': row['description'],
+        'files_count': row['files_count'],
+        'folders_count': row['folders_count'],
+        'total_size': row['total_size'],
+        'total_size_formatted': format_file_size(row['total_size']),
+        'created_at': row['created_at'].isoformat(),
+        'updated_at': row['updated_at'].isoformat()
+    }
+
+PROJECT_ROW_FIELDS = (
+    'id', 'name', 'description', 'files_count', 'folders_count', 'total_size', 'created_at', 'updated_at'
+)
+
+# Seconds a storage_stats/projects_list response is served from cache
+STORAGE_STATS_TTL = 60
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips the exact COUNT(*) for large PostgreSQL result sets.
+
+    Above ESTIMATE_THRESHOLD rows the planner's estimate for the filtered query is
+    used as the total. Smaller results and other databases get a real count.
+
+    The estimate is only a displayed total: a page number past it, or a page that
+    comes back empty inside it, is settled against an exact count instead.
+    """
+    ESTIMATE_THRESHOLD = 10000
+    estimated = False
+
+    @cached_property
+    def count(self):
+        if connection.vendor == 'postgresql':
+            estimate = self._planner_estimate()
+            if estimate is not None and estimate > self.ESTIMATE_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def _use_exact_count(self):
+        self.estimated = False
+        self.count = self.object_list.count()
+        self.__dict__.pop('num_pages', None)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.estimated or int(number) < 1:
+                raise
+            self._use_exact_count()
+            return super().validate_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        # No clamping the slice to the estimate, it may undercount the real rows
+        bottom = (number - 1) * self.per_page
+        page = self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+        if number > 1 and not page.object_list:
+            self._use_exact_count()
+            return self.get_page(number)
+        return page
+
+    def _planner_estimate(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            logger.warning(f"Row estimate failed, counting instead: {e}")
+            return None
+
 class FileManagementViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return DjangoFile.objects.filter(user=self.request.user)
+        # FileSerializer.file_path reads project and folder, join them instead of a query per row
+        return DjangoFile.objects.filter(user=self.request.user).select_related('project', 'folder')
+
+    def get_listing_queryset(self):
+        # Plain dicts with folder and project joined in, no model instances per row
+        return self.get_queryset().values(
+            'id', 'name', 'size', 'content_type', 'uploaded_at',
+            'folder_id', 'folder__name', 'folder__path', 'project_id', 'project__name'
+        )
+
+    def _missing_listing_scope(self, project_id, folder_id):
+        if project_id and not Project.objects.filter(id=project_id, user=self.request.user).exists():
+            return 'Project not found'
+        if folder_id and not Folder.objects.filter(id=folder_id, user=self.request.user).exists():
+            return 'Folder not found'
+        return None
 
     @action(detail=False, methods=['get'])
     def list_files(self, request):
@@ -33,47 +249,51 @@ class FileManagementViewSet(viewsets.ModelViewSet):
         folder_id = request.GET.get('folder_id')
         project_id = request.GET.get('project_id')
         
-        queryset = self.get_queryset()
+        queryset = self.get_listing_queryset()
         
+        # The queryset is already scoped to the user, so foreign ids just yield no rows.
+        # Ownership is only looked up when a page comes back empty, to tell 404 from empty.
         if project_id:
-            try:
-                project = Project.objects.get(id=project_id, user=request.user)
-                queryset = queryset.filter(project=project)
-            except Project.DoesNotExist:
-                return Response({'error': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(project_id=project_id)
         
         if folder_id:
-            try:
-                folder = Folder.objects.get(id=folder_id, user=request.user)
-                queryset = queryset.filter(folder=folder)
-            except Folder.DoesNotExist:
-                return Response({'error': 'Folder not found'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(folder_id=folder_id)
         elif project_id:
             queryset = queryset.filter(folder=None)
         
         if search:
             queryset = queryset.filter(name__icontains=search)
         
-        queryset = queryset.order_by('-uploaded_at')
+        # ?cursor= (empty for the first page) switches to keyset pages without totals
+        cursor = request.GET.get('cursor')
+        if cursor is not None:
+            try:
+                rows, next_cursor = keyset_page(queryset, cursor, page_size)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            if not rows:
+                missing = self._missing_listing_scope(project_id, folder_id)
+                if missing:
+                    return Response({'error': missing}, status=status.HTTP_404_NOT_FOUND)
+            return Response({
+                'files': list(map(listing_row, rows)),
+                'page_size': page_size,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'current_project': project_id,
+                'current_folder': folder_id
+            })
+        
+        queryset = queryset.order_by('-uploaded_at', '-id')
         
-        paginator = Paginator(queryset, page_size)
+        paginator = EstimatedCountPaginator(queryset, page_size)
         page_obj = paginator.get_page(page)
         
-        files_data = []
-        for file_obj in page_obj:
-            files_data.append({
-                'id': str(file_obj.id),
-                'name': file_obj.name,
-                'size': file_obj.size,
-                'content_type': file_obj.content_type,
-                'project': str(file_obj.project.id),
-                'project_name': file_obj.project.name,
-                'folder': str(file_obj.folder.id) if file_obj.folder else None,
-                'folder_name': file_obj.folder.name if file_obj.folder else None,
-                'uploaded_at': file_obj.uploaded_at.isoformat(),
-                'size_formatted': self.format_file_size(file_obj.size),
-                'file_path': file_obj.get_file_path()
-            })
+        files_data = list(map(listing_row, page_obj))
+        if not files_data:
+            missing = self._missing_listing_scope(project_id, folder_id)
+            if missing:
+                return Response({'error': missing}, status=status.HTTP_404_NOT_FOUND)
         
         return Response({
             'files': files_data,
@@ -91,31 +311,30 @@ class FileManagementViewSet(viewsets.ModelViewSet):
         page_size = int(request.GET.get('page_size', 40))
         search = request.GET.get('search', '')
         
-        queryset = self.get_queryset()
+        queryset = self.get_listing_queryset()
         
         if search:
             queryset = queryset.filter(name__icontains=search)
         
-        queryset = queryset.order_by('-uploaded_at')
+        cursor = request.GET.get('cursor')
+        if cursor is not None:
+            try:
+                rows, next_cursor = keyset_page(queryset, cursor, page_size)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'files': list(map(listing_row, rows)),
+                'page_size': page_size,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            })
         
-        paginator = Paginator(queryset, page_size)
+        queryset = queryset.order_by('-uploaded_at', '-id')
+        
+        paginator = EstimatedCountPaginator(queryset, page_size)
         page_obj = paginator.get_page(page)
         
-        files_data = []
-        for file_obj in page_obj:
-            files_data.append({
-                'id': str(file_obj.id),
-                'name': file_obj.name,
-                'size': file_obj.size,
-                'content_type': file_obj.content_type,
-                'project': str(file_obj.project.id),
-                'project_name': file_obj.project.name,
-                'folder': str(file_obj.folder.id) if file_obj.folder else None,
-                'folder_name': file_obj.folder.name if file_obj.folder else None,
-                'uploaded_at': file_obj.uploaded_at.isoformat(),
-                'size_formatted': self.format_file_size(file_obj.size),
-                'file_path': file_obj.get_file_path()
-            })
+        files_data = list(map(listing_row, page_obj))
         
         return Response({
             'files': files_data,
@@ -127,26 +346,29 @@ class FileManagementViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def by_project(self, request):
-        projects = Project.objects.filter(user=request.user).prefetch_related('files', 'folders')
+        projects = list(annotate_project_stats(Project.objects.filter(user=request.user)).values(*PROJECT_ROW_FIELDS))
+        project_ids = [project['id'] for project in projects]
+        project_names = {project['id']: project['name'] for project in projects}
+        
+        # Root files and folders of every project in one query each, grouped here by project
+        root_files = defaultdict(list)
+        for row in DjangoFile.objects.filter(project_id__in=project_ids, folder=None).values(
+            'id', 'name', 'file', 'size', 'content_type', 'project_id', 'uploaded_at'
+        ):
+            root_files[row['project_id']].append(root_file_row(row, project_names[row['project_id']]))
+        
+        root_folders = defaultdict(list)
+        for row in annotate_folder_counts(Folder.objects.filter(project_id__in=project_ids, parent=None)).values(
+            'id', 'name', 'path', 'project_id', 'files_count', 'subfolders_count', 'created_at', 'updated_at'
+        ):
+            root_folders[row['project_id']].append(root_folder_row(row, project_names[row['project_id']]))
         
         projects_data = []
         for project in projects:
-            root_files = project.files.filter(folder=None)
-            root_folders = project.folders.filter(parent=None)
-            
-            projects_data.append({
-                'id': str(project.id),
-                'name': project.name,
-                'description': project.description,
-                'files_count': project.get_files_count(),
-                'folders_count': project.get_folders_count(),
-                'total_size': project.get_total_size(),
-                'total_size_formatted': self.format_file_size(project.get_total_size()),
-                'root_files': FileSerializer(root_files, many=True).data,
-                'root_folders': FolderSerializer(root_folders, many=True).data,
-                'created_at': project.created_at.isoformat(),
-                'updated_at': project.updated_at.isoformat()
-            })
+            data = project_row(project)
+            data['root_files'] = root_files[project['id']]
+            data['root_folders'] = root_folders[project['id']]
+            projects_data.append(data)
         
         return Response({
             'projects': projects_data,
@@ -155,26 +377,21 @@ class FileManagementViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def projects_list(self, request):
-        projects = Project.objects.filter(user=request.user)
+        cache_key = projects_list_cache_key(request.user.id)
+        cached = shared_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached)
         
-        projects_data = []
-        for project in projects:
-            projects_data.append({
-                'id': str(project.id),
-                'name': project.name,
-                'description': project.description,
-                'files_count': project.get_files_count(),
-                'folders_count': project.get_folders_count(),
-                'total_size': project.get_total_size(),
-                'total_size_formatted': self.format_file_size(project.get_total_size()),
-                'created_at': project.created_at.isoformat(),
-                'updated_at': project.updated_at.isoformat()
-            })
+        projects = annotate_project_stats(Project.objects.filter(user=request.user)).values(*PROJECT_ROW_FIELDS)
+        projects_data = list(map(project_row, projects))
         
-        return Response({
+        payload = {
             'projects': projects_data,
             'total_projects': len(projects_data)
-        })
+        }
+        # Dropped on storage changes and on project/folder/file writes (storage.signals)
+        shared_cache.set(cache_key, payload, timeout=STORAGE_STATS_TTL)
+        return Response(payload)
 
     @action(detail=False, methods=['get'])
     def breadcrumb(self, request):
@@ -194,20 +411,15 @@ class FileManagementViewSet(viewsets.ModelViewSet):
                 })
                 
                 if folder_id:
-                    folder = Folder.objects.get(id=folder_id, user=request.user)
-                    current = folder
-                    folder_breadcrumb = []
-                    
-                    while current:
-                        folder_breadcrumb.insert(0, {
-                            'id': str(current.id),
-                            'name': current.name,
-                            'type': 'folder',
-                            'path': current.path
-                        })
-                        current = current.parent
-                    
-                    breadcrumb.extend(folder_breadcrumb)
+                    ancestry = folder_ancestry(folder_id, request.user)
+                    if not ancestry:
+                        raise Folder.DoesNotExist
+                    breadcrumb.extend({
+                        'id': str(folder.id),
+                        'name': folder.name,
+                        'type': 'folder',
+                        'path': folder.path
+                    } for folder in ancestry)
                     
             except (Project.DoesNotExist, Folder.DoesNotExist):
                 return Response({'error': 'Project or folder not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -227,11 +439,24 @@ class FileManagementViewSet(viewsets.ModelViewSet):
         file_path = file_obj.file.path
         
         try:
-            deletion_result = self._force_delete_file_system(file_path)
+            deletion_result = self._delete_from_disk(file_path)
             
+            # The disk is already handled, so skip File.delete (which would unlink and
+            # subtract the size a second time) and settle usage in one UPDATE
             with transaction.atomic():
+                DjangoFile.objects.filter(pk=file_obj.pk).delete()
                 request.user.update_storage_used(file_size, subtract=True)
-                file_obj.delete()
+            
+            if deletion_result.get('scheduled'):
+                logger.info(f"File record deleted, disk removal continues in background: {file_name}")
+                return Response({
+                    'message': 'File deleted, removal from disk continues in background',
+                    'file_name': file_name,
+                    'project_name': project_name,
+                    'size_freed': file_size,
+                    'size_freed_formatted': format_file_size(file_size),
+                    'cleanup_scheduled': True
+                }, status=status.HTTP_202_ACCEPTED)
             
             if deletion_result['success']:
                 logger.info(f"File completely deleted: {file_name} by user {request.user.id}")
@@ -240,7 +465,7 @@ class FileManagementViewSet(viewsets.ModelViewSet):
                     'file_name': file_name,
                     'project_name': project_name,
                     'size_freed': file_size,
-                    'size_freed_formatted': self.format_file_size(file_size)
+                    'size_freed_formatted': format_file_size(file_size)
                 })
             else:
                 logger.warning(f"File record deleted but physical file remains: {file_name}")
@@ -255,27 +480,48 @@ class FileManagementViewSet(viewsets.ModelViewSet):
             logger.error(f"Error deleting file {pk}: {str(e)}")
             return Response({'error': f'Database error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _delete_from_disk(self, file_path):
+        # Plain unlink covers almost every file, only failures pay for the fallback chain
+        try:
+            os.unlink(file_path)
+            return {'success': True, 'method': 'unlink'}
+        except FileNotFoundError:
+            return {'success': True, 'method': 'file_not_found'}
+        except OSError as e:
+            logger.warning(f"Unlink failed for {file_path}, retrying in background: {e}")
+            _deletion_executor.submit(self._force_delete_file_system, file_path)
+            return {'success': False, 'scheduled': True, 'error': str(e)}
+
     def _force_delete_file_system(self, file_path):
         if not os.path.exists(file_path):
             return {'success': True, 'method': 'file_not_found'}
         
-        deletion_methods = [
-            self._kill_processes_and_delete,
-            self._chmod_and_delete,
-            self._sudo_delete,
-            self._move_and_delete,
-            self._shred_delete,
-            self._background_delete
-        ]
-        
-        for method in deletion_methods:
-            try:
-                result = method(file_path)
-                if result['success']:
-                    return result
-            except Exception as e:
-                logger.warning(f"Deletion method {method.__name__} failed: {e}")
-                continue
+        with _force_delete_lock:
+            if file_path in _force_delete_paths:
+                return {'success': False, 'scheduled': True, 'error': 'Deletion already in progress'}
+            _force_delete_paths.add(file_path)
+        try:
+            return self._run_deletion_fallbacks(file_path)
+        finally:
+            with _force_delete_lock:
+                _force_delete_paths.discard(file_path)
+
+    def _run_deletion_fallbacks(self, file_path):
+        result = self._try_deletion_method(self._kill_processes_and_delete, file_path)
+        if result:
+            return result
+        
+        result = self._race_deletion_methods(
+            (self._chmod_and_delete, self._sudo_delete, self._move_and_delete), file_path
+        )
+        if result:
+            return result
+        
+        # shred rewrites the content and is slow, so it only runs once the race is lost
+        for method in (self._shred_delete, self._queue_for_cleanup):
+            result = self._try_deletion_method(method, file_path)
+            if result:
+                return result
         
         return {
             'success': False,
@@ -283,24 +529,63 @@ class FileManagementViewSet(viewsets.ModelViewSet):
             'cleanup_scheduled': True
         }
 
-    def _kill_processes_and_delete(self, file_path):
+    def _try_deletion_method(self, method, file_path):
+        # The method's result when it succeeded, None when it failed or raised
         try:
-            for proc in psutil.process_iter(['pid', 'open_files']):
-                try:
-                    open_files = proc.info['open_files']
-                    if open_files:
-                        for file_info in open_files:
-                            if file_info.path == file_path:
-                                os.kill(proc.info['pid'], signal.SIGKILL)
-                                time.sleep(0.1)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            time.sleep(0.5)
-            os.remove(file_path)
-            return {'success': True, 'method': 'kill_processes'}
-        except:
-            raise
+            result = method(file_path)
+        except Exception as e:
+            logger.warning(f"Deletion method {method.__name__} failed: {e}")
+            return None
+        return result if result['success'] else None
+
+    def _race_deletion_methods(self, methods, file_path):
+        """Run independent deletion methods side by side and return the first success.
+
+        The methods don't depend on each other's outcome, so whichever removes the file
+        first wins and the rest fail harmlessly on the missing path. None when none of them
+        succeeds within FALLBACK_RACE_TIMEOUT seconds.
+        """
+        futures = [_fallback_executor.submit(self._try_deletion_method, method, file_path) for method in methods]
+        try:
+            for future in as_completed(futures, timeout=FALLBACK_RACE_TIMEOUT):
+                result = future.result()
+                if result:
+                    return result
+        except FuturesTimeoutError:
+            logger.warning(f"Deletion fallbacks timed out for {file_path}")
+        return None
+
+    def _file_holders(self, file_path):
+        """PIDs that have file_path open, asked of lsof/fuser instead of walking every process"""
+        for cmd in (['lsof', '-t', '--', file_path], ['fuser', file_path]):
+            try:
+                # lsof -t and fuser both print bare PIDs on stdout (fuser tags them, e.g. "123m")
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
+            except FileNotFoundError:
+                continue
+            return {int(pid.rstrip('cefFrm')) for pid in result.stdout.split()}
+        
+        # Neither tool installed: scan /proc through psutil
+        holders = set()
+        for proc in psutil.process_iter(['pid', 'open_files']):
+            try:
+                if any(f.path == file_path for f in proc.info['open_files'] or ()):
+                    holders.add(proc.info['pid'])
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return holders
+
+    def _kill_processes_and_delete(self, file_path):
+        holders = self._file_holders(file_path) - {os.getpid()}
+        for pid in holders:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                continue
+        if holders:
+            time.sleep(0.1)
+        os.remove(file_path)
+        return {'success': True, 'method': 'kill_processes'}
 
     def _chmod_and_delete(self, file_path):
         parent_dir = os.path.dirname(file_path)
@@ -312,20 +597,28 @@ class FileManagementViewSet(viewsets.ModelViewSet):
         return {'success': True, 'method': 'chmod'}
 
     def _sudo_delete(self, file_path):
-        result = subprocess.run(['sudo', 'rm', '-f', file_path], 
+        # A plain unlink first, sudo rm only when it is refused for lack of permission
+        try:
+            os.unlink(file_path)
+            return {'success': True, 'method': 'unlink'}
+        except PermissionError:
+            pass
+        result = subprocess.run(['sudo', '-n', 'rm', '-f', '--', file_path],
                               capture_output=True, timeout=10)
         if result.returncode == 0:
             return {'success': True, 'method': 'sudo_rm'}
         raise Exception(f"sudo rm failed: {result.stderr.decode()}")
 
     def _move_and_delete(self, file_path):
+        # Rename out of the way (same directory, so a single rename(2)) and unlink the copy
         temp_path = f"{file_path}.delete_{int(time.time())}"
-        shutil.move(file_path, temp_path)
+        os.rename(file_path, temp_path)
         
         try:
-            os.remove(temp_path)
-        except:
-            subprocess.Popen(['rm', '-f', temp_path])
+            os.unlink(temp_path)
+        except OSError:
+            # The record is gone and the name no longer matches it, let cleanup_files finish
+            mark_for_cleanup(temp_path)
         
         return {'success': True, 'method': 'move_delete'}
 
@@ -336,19 +629,10 @@ class FileManagementViewSet(viewsets.ModelViewSet):
             return {'success': True, 'method': 'shred'}
         raise Exception(f"shred failed: {result.stderr.decode()}")
 
-    def _background_delete(self, file_path):
-        script_content = f'''#!/bin/bash
-sleep 5
-sudo rm -f "{file_path}"
-rm -f "$0"
-'''
-        script_path = f"/tmp/delete_{int(time.time())}.sh"
-        with open(script_path, 'w') as f:
-            f.write(script_content)
-        os.chmod(script_path, 0o755)
-        subprocess.Popen(['nohup', script_path])
-        
-        return {'success': False, 'cleanup_scheduled': True, 'method': 'background'}
+    def _queue_for_cleanup(self, file_path):
+        # Last resort: leave it to the cleanup_files command instead of a detached sudo script
+        mark_for_cleanup(file_path)
+        return {'success': False, 'cleanup_scheduled': True, 'method': 'cleanup_queue'}
 
     @action(detail=False, methods=['delete'])
     def bulk_delete(self, request):
@@ -359,42 +643,54 @@ rm -f "$0"
         deleted_files = []
         failed_files = []
         partial_files = []
-        total_size_freed = 0
         
+        requested = {}
         for file_id in file_ids:
             try:
-                file_obj = DjangoFile.objects.get(id=file_id, user=request.user)
-                file_name = file_obj.name
-                file_size = file_obj.size
-                project_name = file_obj.project.name
-                file_path = file_obj.file.path
-                
-                deletion_result = self._force_delete_file_system(file_path)
-                
-                with transaction.atomic():
-                    request.user.update_storage_used(file_size, subtract=True)
-                    file_obj.delete()
-                
-                if deletion_result['success']:
-                    deleted_files.append({
-                        'id': file_id,
-                        'name': file_name,
-                        'size': file_size,
-                        'project_name': project_name
-                    })
-                else:
-                    partial_files.append({
-                        'id': file_id,
-                        'name': file_name,
-                        'warning': 'Record deleted but file may remain on disk'
-                    })
-                
-                total_size_freed += file_size
-                    
-            except DjangoFile.DoesNotExist:
+                requested[uuid.UUID(str(file_id))] = file_id
+            except ValueError:
                 failed_files.append({'id': file_id, 'error': 'File not found'})
-            except Exception as e:
-                failed_files.append({'id': file_id, 'error': str(e)})
+        
+        # Tuples of (id, name, size, stored file name, project name), no model instances
+        files = list(
+            DjangoFile.objects.filter(id__in=requested, user=request.user)
+            .values_list('id', 'name', 'size', 'file', 'project__name')
+        )
+        found_ids = {f[0] for f in files}
+        failed_files.extend(
+            {'id': file_id, 'error': 'File not found'}
+            for parsed_id, file_id in requested.items()
+            if parsed_id not in found_ids
+        )
+        
+        # Unlinking is I/O bound, run the files side by side
+        storage = DjangoFile._meta.get_field('file').storage
+        results = list(_deletion_executor.map(self._delete_from_disk, [storage.path(f[3]) for f in files]))
+        
+        total_size_freed = sum(f[2] for f in files)
+        try:
+            with transaction.atomic():
+                DjangoFile.objects.filter(id__in=found_ids).delete()
+                if total_size_freed:
+                    request.user.update_storage_used(total_size_freed, subtract=True)
+        except Exception as e:
+            logger.error(f"Bulk delete failed for user {request.user.id}: {str(e)}")
+            return Response({'error': f'Database error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        for (file_id, name, size, _, project_name), deletion_result in zip(files, results):
+            if deletion_result['success']:
+                deleted_files.append({
+                    'id': str(file_id),
+                    'name': name,
+                    'size': size,
+                    'project_name': project_name
+                })
+            else:
+                partial_files.append({
+                    'id': str(file_id),
+                    'name': name,
+                    'warning': 'Record deleted, removal from disk continues in background'
+                })
         
         response_data = {
             'deleted_files': deleted_files,
@@ -404,7 +700,7 @@ rm -f "$0"
             'total_partial': len(partial_files),
             'total_failed': len(failed_files),
             'total_size_freed': total_size_freed,
-            'total_size_freed_formatted': self.format_file_size(total_size_freed)
+            'total_size_freed_formatted': format_file_size(total_size_freed)
         }
         
         if failed_files:
@@ -421,58 +717,55 @@ rm -f "$0"
         except DjangoFile.DoesNotExist:
             raise Http404("File not found")
         
-        file_path = file_obj.file.path
-        if not os.path.exists(file_path):
+        try:
+            return file_download_response(file_obj.file.path, file_obj.content_type, file_obj.name, request=request)
+        except FileNotFoundError:
             raise Http404("File not found on server")
-        
-        with open(file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=file_obj.content_type)
-            response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
-            response['Content-Length'] = str(file_obj.size)
-            return response
 
     @action(detail=False, methods=['get'])
     def storage_stats(self, request):
         user = request.user
-        total_files = DjangoFile.objects.filter(user=user).count()
+        cache_key = storage_stats_cache_key(user.id)
+        cached = shared_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached)
+        
         total_folders = Folder.objects.filter(user=user).count()
-        total_projects = Project.objects.filter(user=user).count()
         
         storage_used = user.storage_used
         storage_quota = user.storage_quota
         storage_available = storage_quota - storage_used
         storage_percentage = (storage_used / storage_quota) * 100 if storage_quota > 0 else 0
         
-        file_types = {}
-        files = DjangoFile.objects.filter(user=user)
-        for file_obj in files:
-            content_type = file_obj.content_type.split('/')[0] if '/' in file_obj.content_type else 'other'
-            if content_type not in file_types:
-                file_types[content_type] = {'count': 0, 'size': 0}
-            file_types[content_type]['count'] += 1
-            file_types[content_type]['size'] += file_obj.size
+        file_types = content_kind_breakdown(DjangoFile.objects.filter(user=user))
+        total_files = sum(kind['count'] for kind in file_types.values())
         
         projects_stats = []
-        projects = Project.objects.filter(user=user)
-        for project in projects:
+        total_projects = 0
+        # Stream narrow rows instead of materializing every project of the user
+        projects = annotate_project_stats(Project.objects.filter(user=user)).values(
+            'id', 'name', 'files_count', 'folders_count', 'total_size'
+        )
+        for project in projects.iterator(chunk_size=2000):
+            total_projects += 1
             projects_stats.append({
-                'id': str(project.id),
-                'name': project.name,
-                'files_count': project.get_files_count(),
-                'folders_count': project.get_folders_count(),
-                'total_size': project.get_total_size(),
-                'total_size_formatted': self.format_file_size(project.get_total_size())
+                'id': str(project['id']),
+                'name': project['name'],
+                'files_count': project['files_count'],
+                'folders_count': project['folders_count'],
+                'total_size': project['total_size'],
+                'total_size_formatted': format_file_size(project['total_size'])
             })
         
-        return Response({
+        payload = {
             'storage': {
                 'used': storage_used,
                 'quota': storage_quota,
                 'available': storage_available,
                 'percentage': round(storage_percentage, 2),
-                'used_formatted': self.format_file_size(storage_used),
-                'quota_formatted': self.format_file_size(storage_quota),
-                'available_formatted': self.format_file_size(storage_available)
+                'used_formatted': format_file_size(storage_used),
+                'quota_formatted': format_file_size(storage_quota),
+                'available_formatted': format_file_size(storage_available)
             },
             'overview': {
                 'total_files': total_files,
@@ -481,14 +774,7 @@ rm -f "$0"
                 'file_types': file_types
             },
             'projects': projects_stats
-        })
-
-    def format_file_size(self, bytes_size):
-        if bytes_size == 0:
-            return "0 Bytes"
-        size_names = ["Bytes", "KB", "MB", "GB", "TB"]
-        i = 0
-        while bytes_size >= 1024 and i < len(size_names) - 1:
-            bytes_size /= 1024
-            i += 1
-        return f"{bytes_size:.2f} {size_names[i]}"
\ No newline at end of file
+        }
+        # Dropped on storage changes and on project/folder/file writes (storage.signals)
+        shared_cache.set(cache_key, payload, timeout=STORAGE_STATS_TTL)
+        return Response(payload)
@@ -34,28 +34,23 @@ try:
         user = User.objects.get(username='TAT')
         print(f"Found user: {user.username} ({user.email})")
         
-        # Make user a Django superuser
+        superuser_role, created = WorkflowRole.objects.get_or_create(
+            name=WorkflowRole.SUPERUSER,
+            defaults={
+                'description': 'Superuser with full system access',
+                'permissions': {}
+            }
+        )
+        if created:
+            print("! Superuser workflow role didn't exist, created it")
+        
+        # Make user a Django superuser with the superuser workflow role, one UPDATE of just these columns
         user.is_superuser = True
         user.is_staff = True
-        user.save()
+        user.workflow_role = superuser_role
+        user.save(update_fields=['is_superuser', 'is_staff', 'workflow_role'])
         print("✓ User is now a Django superuser")
-        
-        # Also try to assign superuser workflow role if it exists
-        try:
-            superuser_role = WorkflowRole.objects.get(name=WorkflowRole.SUPERUSER)
-            user.workflow_role = superuser_role
-            user.save()
-            print("✓ User assigned to superuser workflow role")
-        except WorkflowRole.DoesNotExist:
-            print("! Superuser workflow role doesn't exist, creating it...")
-            superuser_role = WorkflowRole.objects.create(
-                name=WorkflowRole.SUPERUSER,
-                description='Superuser with full system access',
-                permissions={}
-            )
-            user.workflow_role = superuser_role
-            user.save()
-            print("✓ Created superuser workflow role and assigned to user")
+        print("✓ User assigned to superuser workflow role")
         
         print(f"\nUser {user.username} is now a superuser!")
         print(f"- Django superuser: {user.is_superuser}")
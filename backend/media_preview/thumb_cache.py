@@ -0,0 +1,96 @@
+"""On-disk cache of generated thumbnails.
+
+Entries are named by a hash of the file id, the source's mtime and size, and the thumbnail
+size, so an edited or replaced source never hits a stale entry and nothing needs to be
+invalidated. Entries for deleted files stop being requested and age out in the trim.
+"""
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+THUMB_EXTENSIONS = {'.jpg': 'image/jpeg', '.png': 'image/png'}
+# One store in this many starts a trim of the cache back under THUMB_CACHE_MAX_BYTES
+TRIM_EVERY = 100
+# Trimming stops once the cache is down to this share of the limit
+TRIM_TARGET = 0.9
+
+_trim_lock = threading.Lock()
+
+
+def thumb_cache_key(file_id, st: os.stat_result, thumb_size: int) -> str:
+    """Cache entry path without its extension"""
+    key = hashlib.sha256(f'{file_id}:{st.st_mtime_ns}:{st.st_size}:{thumb_size}'.encode()).hexdigest()
+    return os.path.join(settings.THUMB_CACHE_DIR, key[:2], key)
+
+
+def cached_thumbnail(cache_key: str) -> Optional[Tuple[str, str]]:
+    """(path, content type) of the cached thumbnail, None on a miss"""
+    for extension, content_type in THUMB_EXTENSIONS.items():
+        path = cache_key + extension
+        if os.path.exists(path):
+            return path, content_type
+    return None
+
+
+def store_thumbnail(cache_key: str, content: bytes, content_type: str):
+    extension = '.png' if content_type == 'image/png' else '.jpg'
+    directory = os.path.dirname(cache_key)
+    os.makedirs(directory, exist_ok=True)
+    # Written beside the entry and renamed over it, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS)
+        os.replace(tmp_path, cache_key + extension)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if random.randrange(TRIM_EVERY) == 0:
+        threading.Thread(target=trim_thumb_cache, daemon=True).start()
+
+
+def trim_thumb_cache():
+    """Delete the oldest entries until the cache fits in TRIM_TARGET of THUMB_CACHE_MAX_BYTES"""
+    if not _trim_lock.acquire(blocking=False):
+        return
+    try:
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(settings.THUMB_CACHE_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= settings.THUMB_CACHE_MAX_BYTES:
+            return
+        target = settings.THUMB_CACHE_MAX_BYTES * TRIM_TARGET
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        logger.info(f"Thumbnail cache trimmed to {total} bytes")
+    except OSError as e:
+        logger.warning(f"Thumbnail cache trim failed: {e}")
+    finally:
+        _trim_lock.release()
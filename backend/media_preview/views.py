@@ -3,27 +3,71 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import CachedJWTAuthentication
 from django.http import HttpResponse, Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.conf import settings
 from PIL import Image
 import zipfile
 import tarfile
 import rarfile
+try:
+    import libarchive
+    LIBARCHIVE_AVAILABLE = True
+except ImportError:
+    LIBARCHIVE_AVAILABLE = False
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except ImportError:
+    PYVIPS_AVAILABLE = False
 import os
-import mimetypes
 import logging
 from io import BytesIO
 import json
-import shutil
-from storage.models import File as DjangoFile, Folder, Project
+import functools
+import itertools
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from django.db.models import Q
+from storage.models import File as DjangoFile, Folder, Project, detect_content_type
+from users.models import invalidate_stats_caches
+from file_management.views import format_file_size
+from core.downloads import file_download_response
+from video_processing.hls import hls_playlist_name
+from media_preview.thumb_cache import thumb_cache_key, cached_thumbnail, store_thumbnail
 from django.core.files import File
 from celery import shared_task
 
 logger = logging.getLogger(__name__)
 
+# File rows written per INSERT when extracting an archive
+ARCHIVE_INSERT_BATCH = 500
+# Threads decompressing and writing archive members at once, and members queued per thread
+ARCHIVE_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+ARCHIVE_EXTRACT_QUEUE = 4
+
+class _BlockReader:
+    """Minimal read() over an iterator of byte blocks, for libarchive entry data"""
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._buffer += block
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
 class FilePreviewViewSet(viewsets.ViewSet):
-    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
     @action(detail=True, methods=['get'])
@@ -101,79 +145,25 @@ class FilePreviewViewSet(viewsets.ViewSet):
         try:
             file_obj = DjangoFile.objects.get(id=pk, user=request.user)
             
-            if not os.path.exists(file_obj.file.path):
+            try:
+                st = os.stat(file_obj.file.path)
+            except FileNotFoundError:
                 raise Http404("File not found on server")
             
             thumbnail_size = request.GET.get('size', '300')
             if thumbnail_size not in ['150', '300', '600', '800']:
                 thumbnail_size = '300'
-                
-            with Image.open(file_obj.file.path) as img:
-                thumb_size = int(thumbnail_size)
-                img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
-                
-                buffer = BytesIO()
-                img_format = img.format or 'JPEG'
-                if img_format.upper() in ['JPEG', 'JPG']:
-                    img.save(buffer, format='JPEG', quality=85)
-                    content_type = 'image/jpeg'
-                elif img_format.upper() == 'PNG':
-                    img.save(buffer, format='PNG')
-                    content_type = 'image/png'
-                else:
-                    img = img.convert('RGB')
-                    img.save(buffer, format='JPEG', quality=85)
-                    content_type = 'image/jpeg'
-                
-                buffer.seek(0)
-                
-                response = HttpResponse(buffer.getvalue(), content_type=content_type)
-                response['Cache-Control'] = 'public, max-age=3600'
-                response['Access-Control-Allow-Origin'] = '*'
-                response['Content-Length'] = str(len(buffer.getvalue()))
-                return response
-                
-        except DjangoFile.DoesNotExist:
-            raise Http404("File not found")
-        except Exception as e:
-            logger.error(f"Thumbnail error: {str(e)}")
-            raise Http404("Thumbnail generation failed")
-
-    @action(detail=True, methods=['get'])
-    def thumbnail(self, request, pk=None):
-        try:
-            file_obj = DjangoFile.objects.get(id=pk, user=request.user)
             
-            if not os.path.exists(file_obj.file.path):
-                raise Http404("File not found on server")
-            
-            thumbnail_size = request.GET.get('size', '300')
-            if thumbnail_size not in ['150', '300', '600', '800']:
-                thumbnail_size = '300'
-                
-            with Image.open(file_obj.file.path) as img:
-                thumb_size = int(thumbnail_size)
-                img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
-                
-                buffer = BytesIO()
-                img_format = img.format or 'JPEG'
-                if img_format.upper() == 'JPEG' or img_format.upper() == 'JPG':
-                    img.save(buffer, format='JPEG', quality=85)
-                    content_type = 'image/jpeg'
-                elif img_format.upper() == 'PNG':
-                    img.save(buffer, format='PNG')
-                    content_type = 'image/png'
-                else:
-                    img = img.convert('RGB')
-                    img.save(buffer, format='JPEG', quality=85)
-                    content_type = 'image/jpeg'
-                
-                buffer.seek(0)
-                
-                response = HttpResponse(buffer.getvalue(), content_type=content_type)
-                response['Cache-Control'] = 'public, max-age=3600'
-                response['Access-Control-Allow-Origin'] = '*'
-                return response
+            # The source's mtime and size identify the thumbnail, so a revalidation costs one stat
+            etag = quote_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}-{thumbnail_size}')
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = self._thumbnail_response(file_obj, st, int(thumbnail_size))
+            response['ETag'] = etag
+            # The URL stays the same when the file changes, so browsers revalidate against the ETag
+            response['Cache-Control'] = 'private, no-cache'
+            response['Access-Control-Allow-Origin'] = '*'
+            return response
                 
         except DjangoFile.DoesNotExist:
             raise Http404("File not found")
@@ -181,31 +171,77 @@ class FilePreviewViewSet(viewsets.ViewSet):
             logger.error(f"Thumbnail error: {str(e)}")
             
             file_obj = DjangoFile.objects.get(id=pk, user=request.user)
-            direct_url = f'http://localhost:8000/media/{file_obj.file.name}'
             
             try:
-                # Read file directly from filesystem instead of HTTP request
-                if os.path.exists(file_obj.file.path):
-                    with open(file_obj.file.path, 'rb') as f:
-                        file_content = f.read()
-                    response = HttpResponse(file_content, content_type=file_obj.content_type)
-                    response['Cache-Control'] = 'public, max-age=3600'
-                    response['Access-Control-Allow-Origin'] = '*'
-                    return response
+                # Serve the original instead, streamed (or sent by nginx), never read whole
+                response = file_download_response(
+                    file_obj.file.path, file_obj.content_type, file_obj.name, as_attachment=False, request=request
+                )
+                response['Cache-Control'] = 'public, max-age=3600'
+                response['Access-Control-Allow-Origin'] = '*'
+                return response
             except Exception as e:
                 logger.error(f"Direct file access failed: {str(e)}")
                 
             raise Http404("Thumbnail generation failed")
 
+    def _thumbnail_response(self, file_obj, st, thumb_size):
+        cache_key = thumb_cache_key(file_obj.id, st, thumb_size)
+        cached = cached_thumbnail(cache_key)
+        if cached:
+            # Sent by nginx when DOWNLOAD_ACCEL_REDIRECT_PREFIX is set, nothing decoded either way
+            path, content_type = cached
+            return file_download_response(path, content_type, os.path.basename(path), as_attachment=False)
+        
+        thumbnail = self._vips_thumbnail(file_obj.file.path, thumb_size) if PYVIPS_AVAILABLE else None
+        content, content_type = thumbnail or self._pil_thumbnail(file_obj.file.path, thumb_size)
+        try:
+            store_thumbnail(cache_key, content, content_type)
+        except OSError as e:
+            logger.warning(f"Could not cache thumbnail for file {file_obj.id}: {e}")
+        return HttpResponse(content, content_type=content_type)
+
+    def _vips_thumbnail(self, path, thumb_size):
+        """(content, content type) from libvips, which decodes only what the thumbnail needs; None to use PIL"""
+        try:
+            image = pyvips.Image.thumbnail(path, thumb_size, height=thumb_size, size='down')
+            if image.get('vips-loader').startswith('png'):
+                return image.write_to_buffer('.png'), 'image/png'
+            return image.write_to_buffer('.jpg[Q=85,optimize_coding,strip]'), 'image/jpeg'
+        except pyvips.Error as e:
+            logger.warning(f"libvips thumbnail failed for {path}, using PIL: {e}")
+            return None
+
+    def _pil_thumbnail(self, path, thumb_size):
+        with Image.open(path) as img:
+            img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
+            
+            buffer = BytesIO()
+            img_format = img.format or 'JPEG'
+            if img_format.upper() == 'JPEG' or img_format.upper() == 'JPG':
+                img.save(buffer, format='JPEG', quality=85)
+                content_type = 'image/jpeg'
+            elif img_format.upper() == 'PNG':
+                img.save(buffer, format='PNG')
+                content_type = 'image/png'
+            else:
+                img = img.convert('RGB')
+                img.save(buffer, format='JPEG', quality=85)
+                content_type = 'image/jpeg'
+            
+            return buffer.getvalue(), content_type
+
     def _preview_video(self, file_obj, request):
         relative_path = file_obj.file.name
+        playlist_name = hls_playlist_name(file_obj.id)
         
         return JsonResponse({
             'type': 'video',
             'content_type': file_obj.content_type,
             'size': file_obj.size,
-            'size_formatted': self._format_file_size(file_obj.size),
+            'size_formatted': format_file_size(file_obj.size),
             'stream_url': f'http://localhost:8000/media/{relative_path}',
+            'manifest_url': f'http://localhost:8000/media/{playlist_name}' if playlist_name else None,
             'supports_streaming': True,
             'video_info': {
                 'file_size': file_obj.size,
@@ -228,22 +264,25 @@ class FilePreviewViewSet(viewsets.ViewSet):
     def _preview_text(self, file_obj, request):
         try:
             max_size = 1024 * 1024
-            if file_obj.size > max_size:
-                return JsonResponse({'error': 'File too large for text preview'}, 
-                              status=400)
-            
+            # Universal newlines, so CRLF and CR files come out with plain \n like before
             with open(file_obj.file.path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                
-            lines = content.split('\n')
-            if len(lines) > 1000:
-                content = '\n'.join(lines[:1000]) + '\n... (truncated)'
+                # Size on disk, file_obj.size can lag behind a rewrite of the file
+                if os.fstat(f.fileno()).st_size > max_size:
+                    return JsonResponse({'error': 'File too large for text preview'}, 
+                                  status=400)
+                # Only the lines shown are read; a 1000th line ending in a newline means more follow
+                lines = list(itertools.islice(f, 1000))
+            
+            content = ''.join(lines)
+            truncated = len(lines) == 1000 and content.endswith('\n')
+            if truncated:
+                content += '... (truncated)'
                 
             return JsonResponse({
                 'type': 'text',
                 'content': content,
-                'lines': min(len(lines), 1000),
-                'truncated': len(lines) > 1000
+                'lines': 1000 if truncated else content.count('\n') + 1,
+                'truncated': truncated
             })
             
         except Exception as e:
@@ -259,28 +298,8 @@ class FilePreviewViewSet(viewsets.ViewSet):
             'message': 'PDF preview requires download'
         })
 
-    def _format_file_size(self, bytes_size):
-        if bytes_size == 0:
-            return "0 Bytes"
-        size_names = ["Bytes", "KB", "MB", "GB", "TB"]
-        i = 0
-        while bytes_size >= 1024 and i < len(size_names) - 1:
-            bytes_size /= 1024
-            i += 1
-        return f"{bytes_size:.2f} {size_names[i]}"
-
-    def _format_file_size(self, bytes_size):
-        if bytes_size == 0:
-            return "0 Bytes"
-        size_names = ["Bytes", "KB", "MB", "GB", "TB"]
-        i = 0
-        while bytes_size >= 1024 and i < len(size_names) - 1:
-            bytes_size /= 1024
-            i += 1
-        return f"{bytes_size:.2f} {size_names[i]}"
-
 class ArchiveViewSet(viewsets.ViewSet):
-    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
     @action(detail=True, methods=['get'])
@@ -355,7 +374,7 @@ class ArchiveViewSet(viewsets.ViewSet):
                               status=status.HTTP_400_BAD_REQUEST)
             
             target_folder_id = request.data.get('target_folder_id')
-            target_project_id = request.data.get('target_project_id', file_obj.project.id)
+            target_project_id = request.data.get('target_project_id', file_obj.project_id)
             create_subfolder = request.data.get('create_subfolder', True)
             selected_files = request.data.get('selected_files', [])  # List of file paths to extract
             max_files = request.data.get('max_files', 1000)  # Limit extraction count
@@ -366,17 +385,21 @@ class ArchiveViewSet(viewsets.ViewSet):
             
             if target_folder_id:
                 target_folder = Folder.objects.get(id=target_folder_id, user=request.user)
-                if target_folder.project != target_project:
+                if target_folder.project_id != target_project.id:
                     return Response({'error': 'Folder does not belong to target project'}, 
                                   status=status.HTTP_400_BAD_REQUEST)
             
-            # Get total files to determine if background processing is needed
-            all_contents = self._list_archive_contents(file_obj.file.path, archive_type)
-            total_files_to_extract = len(selected_files) if selected_files else len(all_contents)
+            # Temporarily disabled due to Celery configuration issues
+            background_enabled = False
+            
+            # Get total files to determine if background processing is needed; listing is a
+            # full pass over the archive, so skip it while there is no background option
+            if background_enabled:
+                all_contents = self._list_archive_contents(file_obj.file.path, archive_type)
+                total_files_to_extract = len(selected_files) if selected_files else len(all_contents)
             
             # Use background processing for large extractions (>500 files) or if requested
-            # Temporarily disabled due to Celery configuration issues
-            if False and (use_background or total_files_to_extract > 500):
+            if background_enabled and (use_background or total_files_to_extract > 500):
                 task = extract_archive_background.delay(
                     file_id=file_obj.id,
                     target_project_id=target_project_id,
@@ -547,135 +570,194 @@ class ArchiveViewSet(viewsets.ViewSet):
         ]
         return ext in previewable_extensions
 
-    def _extract_archive(self, file_path, archive_type, target_project, target_folder, user, selected_files=None, max_files=1000):
-        import gc
-        import uuid
+    def _archive_members(self, archive, archive_type):
+        """(name, is_dir, open_member) for each entry, in archive order; links and devices skipped"""
+        if archive_type == 'tar':
+            # Iterating reads headers as it goes instead of indexing the whole tar first
+            for member in archive:
+                if member.isdir():
+                    yield member.name, True, None
+                elif member.isfile():
+                    yield member.name, False, functools.partial(archive.extractfile, member)
+        else:
+            for info in archive.infolist():
+                yield info.filename, info.is_dir(), functools.partial(archive.open, info)
+
+    def _resolve_folders(self, dir_paths, target_project, target_folder, user):
+        """{path parts tuple: Folder} for every directory, looked up or created one depth at a time"""
+        folders = {(): target_folder}
+        by_depth = defaultdict(set)
+        for parts in dir_paths:
+            for depth in range(1, len(parts) + 1):
+                by_depth[depth].add(parts[:depth])
+        
+        for depth in sorted(by_depth):
+            wanted = by_depth[depth]
+            parents = {folders[parts[:-1]] for parts in wanted}
+            parent_filter = Q(parent__in=[parent for parent in parents if parent is not None])
+            if None in parents:
+                parent_filter |= Q(parent__isnull=True)
+            existing = {
+                (folder.parent_id, folder.name): folder
+                for folder in Folder.objects.filter(
+                    parent_filter, project=target_project, user=user, name__in={parts[-1] for parts in wanted}
+                )
+            }
+            
+            missing = []
+            for parts in wanted:
+                parent = folders[parts[:-1]]
+                folder = existing.get((parent.id if parent else None, parts[-1]))
+                if folder is None:
+                    # bulk_create skips Folder.save(), so set the path it would have computed
+                    folder = Folder(
+                        name=parts[-1], parent=parent, project=target_project, user=user,
+                        path=f"{parent.path}/{parts[-1]}" if parent and parent.path else parts[-1]
+                    )
+                    missing.append(folder)
+                folders[parts] = folder
+            Folder.objects.bulk_create(missing)
+        return folders
+
+    def _member_streams(self, file_path, archive_type, entries):
+        """(parts, readable) for each (parts, name, open_member) entry, each valid until the next.
+
+        RAR data comes from libarchive in one sequential in-process read when it is installed;
+        rarfile would start an unrar process per member.
+        """
+        if archive_type == 'rar' and LIBARCHIVE_AVAILABLE:
+            wanted = {name: parts for parts, name, _ in entries}
+            with libarchive.file_reader(file_path) as reader:
+                for entry in reader:
+                    parts = wanted.pop(entry.pathname, None)
+                    if parts is not None:
+                        yield parts, _BlockReader(entry.get_blocks())
+                    if not wanted:
+                        break
+            return
+        for parts, _, open_member in entries:
+            with open_member() as member:
+                yield parts, member
+
+    def _stored_files(self, file_path, archive_type, entries, store, discard):
+        """store(parts, readable) for each (parts, name, open_member) entry, results in archive order.
+
+        Zip members (and rarfile's per-member unrar runs) open independently, so a few threads
+        decompress and write them at once, with a bounded number queued ahead. Tar streams and
+        libarchive reads are sequential and stay on this thread. If extraction stops early, queued
+        members are cancelled and discard() is called on results that were never handed out.
+        """
+        if archive_type == 'tar' or (archive_type == 'rar' and LIBARCHIVE_AVAILABLE) or ARCHIVE_EXTRACT_WORKERS < 2:
+            for parts, member in self._member_streams(file_path, archive_type, entries):
+                yield store(parts, member)
+            return
         
-        extracted_files = []
-        extract_id = str(uuid.uuid4())
-        base_extract_path = os.path.join(settings.MEDIA_ROOT, 'temp', 'extract', extract_id)
-        os.makedirs(base_extract_path, exist_ok=True)
+        def store_entry(entry):
+            parts, _, open_member = entry
+            with open_member() as member:
+                return store(parts, member)
         
+        executor = ThreadPoolExecutor(max_workers=ARCHIVE_EXTRACT_WORKERS)
+        pending = deque()
         try:
-            # Extract selectively if specific files requested
-            if selected_files:
-                extracted_count = 0
-                
-                if archive_type == 'zip':
-                    with zipfile.ZipFile(file_path, 'r') as archive:
-                        for file_name in selected_files:
-                            if extracted_count >= max_files:
-                                break
-                            try:
-                                archive.extract(file_name, base_extract_path)
-                                extracted_count += 1
-                            except KeyError:
-                                logger.warning(f"File {file_name} not found in archive")
-                                
-                elif archive_type == 'tar':
-                    with tarfile.open(file_path, 'r:*') as archive:
-                        for file_name in selected_files:
-                            if extracted_count >= max_files:
-                                break
-                            try:
-                                member = archive.getmember(file_name)
-                                archive.extract(member, base_extract_path)
-                                extracted_count += 1
-                            except KeyError:
-                                logger.warning(f"File {file_name} not found in archive")
-                                
-                elif archive_type == 'rar':
-                    with rarfile.RarFile(file_path, 'r') as archive:
-                        for file_name in selected_files:
-                            if extracted_count >= max_files:
-                                break
-                            try:
-                                archive.extract(file_name, base_extract_path)
-                                extracted_count += 1
-                            except Exception:
-                                logger.warning(f"File {file_name} not found in archive")
-            else:
-                # Extract all files but with limits
-                if archive_type == 'zip':
-                    with zipfile.ZipFile(file_path, 'r') as archive:
-                        members = archive.infolist()[:max_files]
-                        for member in members:
-                            archive.extract(member, base_extract_path)
-                            
-                elif archive_type == 'tar':
-                    with tarfile.open(file_path, 'r:*') as archive:
-                        members = archive.getmembers()[:max_files]
-                        for member in members:
-                            archive.extract(member, base_extract_path)
-                            
-                elif archive_type == 'rar':
-                    with rarfile.RarFile(file_path, 'r') as archive:
-                        members = archive.infolist()[:max_files]
-                        for member in members:
-                            archive.extract(member, base_extract_path)
-            
-            # Process extracted files in batches
-            batch_size = 50
-            current_batch = 0
-            
-            for root, dirs, files in os.walk(base_extract_path):
-                rel_path = os.path.relpath(root, base_extract_path)
-                
-                current_folder = target_folder
-                if rel_path != '.':
-                    path_parts = rel_path.split(os.sep)
-                    for part in path_parts:
-                        folder_name = part
-                        current_folder, created = Folder.objects.get_or_create(
-                            name=folder_name,
-                            parent=current_folder,
-                            project=target_project,
-                            user=user
-                        )
-                
-                for file_name in files:
-                    if len(extracted_files) >= max_files:
-                        break
-                        
-                    file_path_full = os.path.join(root, file_name)
-                    
-                    with open(file_path_full, 'rb') as f:
-                        django_file = File(f, name=file_name)
-                        
-                        file_obj = DjangoFile.objects.create(
-                            name=file_name,
-                            file=django_file,
-                            size=os.path.getsize(file_path_full),
-                            content_type=mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
-                            folder=current_folder,
-                            project=target_project,
-                            user=user
-                        )
-                        
-                        extracted_files.append(file_obj)
-                        current_batch += 1
-                        
-                        # Cleanup memory every batch
-                        if current_batch >= batch_size:
-                            gc.collect()
-                            current_batch = 0
-            
-            # Final cleanup
-            shutil.rmtree(base_extract_path, ignore_errors=True)
-            gc.collect()
-            
-        except Exception as e:
-            shutil.rmtree(base_extract_path, ignore_errors=True)
-            gc.collect()
+            for entry in entries:
+                if len(pending) >= ARCHIVE_EXTRACT_WORKERS * ARCHIVE_EXTRACT_QUEUE:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(store_entry, entry))
+            while pending:
+                yield pending.popleft().result()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    discard(future.result())
             raise
+        finally:
+            executor.shutdown(wait=True)
+
+    def _extract_archive(self, file_path, archive_type, target_project, target_folder, user, selected_files=None, max_files=1000):
+        """Copy archive entries straight into storage and create their File rows in batches.
+
+        The entries are listed first and their folders resolved with a couple of queries per
+        depth. Each member is then streamed once from the archive into storage (no temp
+        extraction dir); tar members are read back through extractfile and libarchive reopens
+        a RAR for its sequential read. The rows are written with bulk_create.
+        """
+        openers = {'zip': zipfile.ZipFile, 'tar': tarfile.open, 'rar': rarfile.RarFile}
+        selected = set(selected_files or ())
+        
+        with openers[archive_type](file_path, 'r:*' if archive_type == 'tar' else 'r') as archive:
+            dir_paths = set()
+            entries = []
+            found = set()
+            for name, is_dir, open_member in self._archive_members(archive, archive_type):
+                # Only plain path segments become folder names, '..' and absolute parts are dropped
+                parts = tuple(part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..'))
+                if not parts:
+                    continue
+                if is_dir:
+                    if not selected:
+                        dir_paths.add(parts)
+                    continue
+                if selected:
+                    if name not in selected:
+                        continue
+                    found.add(name)
+                if len(entries) >= max_files:
+                    break
+                dir_paths.add(parts[:-1])
+                entries.append((parts, name, open_member))
+            else:
+                for name in selected - found:
+                    logger.warning(f"File {name} not found in archive")
+            
+            folders = self._resolve_folders(dir_paths, target_project, target_folder, user)
+            
+            def store(parts, member):
+                # Storage writes only; rows are inserted on this thread below
+                file_name = parts[-1]
+                file_obj = DjangoFile(
+                    name=file_name,
+                    content_type=detect_content_type(file_name),
+                    folder=folders[parts[:-1]],
+                    project=target_project,
+                    user=user
+                )
+                file_obj.file.save(file_name, File(member), save=False)
+                file_obj.size = file_obj.file.size
+                return file_obj
+            
+            def discard(file_obj):
+                try:
+                    file_obj.file.delete(save=False)
+                except OSError as e:
+                    logger.warning(f"Could not remove partially extracted {file_obj.file.name}: {e}")
+            
+            extracted_files = []
+            batch = []
+            stored_files = self._stored_files(file_path, archive_type, entries, store, discard)
+            try:
+                for file_obj in stored_files:
+                    batch.append(file_obj)
+                    if len(batch) >= ARCHIVE_INSERT_BATCH:
+                        extracted_files.extend(DjangoFile.objects.bulk_create(batch))
+                        batch = []
+                extracted_files.extend(DjangoFile.objects.bulk_create(batch))
+            except BaseException:
+                # Stored members without a row yet would be left on disk, uncharged and unlisted
+                stored_files.close()
+                for file_obj in batch:
+                    discard(file_obj)
+                raise
         
+        # bulk_create sends no post_save, so drop the stats caches the signals would have
+        invalidate_stats_caches(user.id)
         return extracted_files
 
 @shared_task
 def extract_archive_background(file_id, target_project_id, target_folder_id=None, create_subfolder=True, selected_files=None, max_files=1000, user_id=None):
     """Background task for extracting large archives"""
-    import gc
-    import uuid
     from users.models import User
     
     try:
@@ -696,110 +778,31 @@ def extract_archive_background(file_id, target_project_id, target_folder_id=None
                 user=user
             )
         
-        # Get archive type
-        extension = os.path.splitext(file_obj.name)[1].lower()
-        if extension in ['.zip']:
-            archive_type = 'zip'
-        elif extension in ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz']:
-            archive_type = 'tar'
-        elif extension in ['.rar']:
-            archive_type = 'rar'
-        else:
+        viewset = ArchiveViewSet()
+        archive_type = viewset._get_archive_type(file_obj)
+        if not archive_type:
             raise ValueError("Unsupported archive type")
         
-        # Extract files
-        extracted_files = []
-        extract_id = str(uuid.uuid4())
-        base_extract_path = os.path.join(settings.MEDIA_ROOT, 'temp', 'extract', extract_id)
-        os.makedirs(base_extract_path, exist_ok=True)
+        extracted_files = viewset._extract_archive(
+            file_obj.file.path,
+            archive_type,
+            target_project,
+            target_folder,
+            user,
+            selected_files=selected_files,
+            max_files=max_files
+        )
         
-        try:
-            # Extract with limits
-            if selected_files:
-                extracted_count = 0
-                
-                if archive_type == 'zip':
-                    with zipfile.ZipFile(file_obj.file.path, 'r') as archive:
-                        for file_name in selected_files:
-                            if extracted_count >= max_files:
-                                break
-                            try:
-                                archive.extract(file_name, base_extract_path)
-                                extracted_count += 1
-                            except KeyError:
-                                logger.warning(f"File {file_name} not found in archive")
-            else:
-                # Extract all with limits
-                if archive_type == 'zip':
-                    with zipfile.ZipFile(file_obj.file.path, 'r') as archive:
-                        members = archive.infolist()[:max_files]
-                        for member in members:
-                            archive.extract(member, base_extract_path)
-            
-            # Process extracted files in batches
-            batch_size = 50
-            current_batch = 0
-            
-            for root, dirs, files in os.walk(base_extract_path):
-                rel_path = os.path.relpath(root, base_extract_path)
-                
-                current_folder = target_folder
-                if rel_path != '.':
-                    path_parts = rel_path.split(os.sep)
-                    for part in path_parts:
-                        current_folder, created = Folder.objects.get_or_create(
-                            name=part,
-                            parent=current_folder,
-                            project=target_project,
-                            user=user
-                        )
-                
-                for file_name in files:
-                    if len(extracted_files) >= max_files:
-                        break
-                        
-                    file_path_full = os.path.join(root, file_name)
-                    
-                    with open(file_path_full, 'rb') as f:
-                        django_file = File(f, name=file_name)
-                        
-                        file_obj_new = DjangoFile.objects.create(
-                            name=file_name,
-                            file=django_file,
-                            size=os.path.getsize(file_path_full),
-                            content_type=mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
-                            folder=current_folder,
-                            project=target_project,
-                            user=user
-                        )
-                        
-                        extracted_files.append(file_obj_new.id)
-                        current_batch += 1
-                        
-                        # Cleanup memory every batch
-                        if current_batch >= batch_size:
-                            gc.collect()
-                            current_batch = 0
-            
-            # Final cleanup
-            shutil.rmtree(base_extract_path, ignore_errors=True)
-            gc.collect()
-            
-            logger.info(f"Background extraction completed: {len(extracted_files)} files extracted")
-            return {
-                'status': 'completed',
-                'extracted_files': len(extracted_files),
-                'file_ids': extracted_files
-            }
-            
-        except Exception as e:
-            shutil.rmtree(base_extract_path, ignore_errors=True)
-            gc.collect()
-            raise
+        logger.info(f"Background extraction completed: {len(extracted_files)} files extracted")
+        return {
+            'status': 'completed',
+            'extracted_files': len(extracted_files),
+            'file_ids': [file_obj_new.id for file_obj_new in extracted_files]
+        }
         
     except Exception as e:
         logger.error(f"Background extraction failed: {str(e)}")
         return {
             'status': 'failed',
             'error': str(e)
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 14:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0010_increase_file_field_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='file_user_uploaded_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', 'folder', '-uploaded_at', '-id'], name='file_user_folder_upl_id_idx'),
+        ),
+    ]
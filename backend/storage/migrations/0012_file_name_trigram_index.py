@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_name_trigram_index(apps, schema_editor):
+    """Trigram index behind the name__icontains file search, PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('storage', 'File')._meta.db_table
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    # icontains compiles to UPPER("name"::text) LIKE UPPER(%s), so index that exact expression
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS file_name_trgm ON "{table}" USING gin ((UPPER("name"::text)) gin_trgm_ops);'
+    )
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS file_name_trgm;")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('storage', '0011_file_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_trigram_index, drop_name_trigram_index),
+    ]
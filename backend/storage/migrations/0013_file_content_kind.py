@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 15:10
+
+import django.db.models.expressions
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0012_file_name_trigram_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_kind',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(content_type__contains='/', then=django.db.models.functions.text.Substr('content_type', 1, django.db.models.expressions.CombinedExpression(django.db.models.functions.text.StrIndex('content_type', models.Value('/')), '-', models.Value(1)))), default=models.Value('other')), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', 'content_kind'], name='file_user_content_kind_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models.functions import Coalesce, StrIndex, Substr
 from django.utils.translation import gettext_lazy as _
 import uuid
 import os
@@ -81,7 +82,7 @@ class Project(models.Model):
     def can_user_access(self, user):
         """Check if a user can access this project"""
         # Admin (creator) always has access
-        if self.user == user or user.is_admin_role():
+        if self.user_id == user.id or user.is_admin_role():
             return True
         
         # Check if user is assigned to this project
@@ -132,6 +133,17 @@ def user_directory_path(instance, filename):
     folder_path = instance.folder.path if instance.folder else ""
     return f'user_{instance.user.id}/{project_path}/{folder_path}/{filename}'
 
+def mark_for_cleanup(file_path):
+    """Queue a file the server could not delete; the cleanup_files command retries it"""
+    cleanup_file = os.path.join(os.path.dirname(file_path), '.cleanup_queue')
+    try:
+        os.makedirs(os.path.dirname(cleanup_file), exist_ok=True)
+        with open(cleanup_file, 'a') as f:
+            f.write(f"{file_path}\n")
+        logger.warning(f"File marked for cleanup: {file_path}")
+    except Exception as e:
+        logger.error(f"Failed to mark file for cleanup: {e}")
+
 class Folder(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
@@ -179,6 +191,15 @@ class File(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='files', null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Content type before '/' ('image', 'video', ...), 'other' without one; kept by the database
+    content_kind = models.GeneratedField(
+        expression=models.Case(
+            models.When(content_type__contains='/', then=Substr('content_type', 1, StrIndex('content_type', models.Value('/')) - 1)),
+            default=models.Value('other')
+        ),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+    )
     
     def save(self, *args, **kwargs):
         if not self.content_type or self.content_type == 'application/octet-stream':
@@ -240,14 +261,7 @@ class File(models.Model):
             self._mark_for_cleanup(file_path)
     
     def _mark_for_cleanup(self, file_path):
-        cleanup_file = os.path.join(os.path.dirname(file_path), '.cleanup_queue')
-        try:
-            os.makedirs(os.path.dirname(cleanup_file), exist_ok=True)
-            with open(cleanup_file, 'a') as f:
-                f.write(f"{file_path}\n")
-            logger.warning(f"File marked for cleanup: {file_path}")
-        except Exception as e:
-            logger.error(f"Failed to mark file for cleanup: {e}")
+        mark_for_cleanup(file_path)
     
     def get_file_path(self):
         project_name = self.project.name if self.project else 'No Project'
@@ -260,6 +274,56 @@ class File(models.Model):
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Listing pages: filter by user (and folder), newest first, id breaks ties for keyset cursors
+            models.Index(fields=['user', '-uploaded_at', '-id'], name='file_user_uploaded_id_idx'),
+            models.Index(fields=['user', 'folder', '-uploaded_at', '-id'], name='file_user_folder_upl_id_idx'),
+            models.Index(fields=['user', 'content_kind'], name='file_user_content_kind_idx'),
+        ]
+
+def annotate_project_stats(queryset):
+    """Attach files_count, folders_count and total_size to each project in the same query.
+
+    Correlated subqueries rather than Count/Sum over joins, which would multiply
+    file sizes by the number of folders.
+    """
+    project_files = File.objects.filter(project=models.OuterRef('pk')).order_by().values('project')
+    project_folders = Folder.objects.filter(project=models.OuterRef('pk')).order_by().values('project')
+    return queryset.annotate(
+        files_count=Coalesce(models.Subquery(project_files.annotate(n=models.Count('id')).values('n')), 0),
+        folders_count=Coalesce(models.Subquery(project_folders.annotate(n=models.Count('id')).values('n')), 0),
+        total_size=Coalesce(models.Subquery(project_files.annotate(total=models.Sum('size')).values('total')), 0),
+    )
+
+def folder_ancestry(folder_id, user):
+    """Return the folder and its ancestors root first, walked in a single recursive query"""
+    try:
+        pk = Folder._meta.pk.get_db_prep_value(uuid.UUID(str(folder_id)), connection)
+        user_pk = Folder._meta.get_field('user').get_db_prep_value(user.pk, connection)
+    except ValueError:
+        return []
+    table = connection.ops.quote_name(Folder._meta.db_table)
+    return list(Folder.objects.raw(
+        f"""
+        WITH RECURSIVE anc(id, name, path, parent_id, depth) AS (
+            SELECT id, name, path, parent_id, 0 FROM {table} WHERE id = %s AND user_id = %s
+            UNION ALL
+            SELECT f.id, f.name, f.path, f.parent_id, anc.depth + 1
+            FROM {table} f JOIN anc ON anc.parent_id = f.id
+        )
+        SELECT id, name, path, parent_id FROM anc ORDER BY depth DESC
+        """,
+        [pk, user_pk],
+    ))
+
+def content_kind_breakdown(files):
+    """{kind: {'count', 'size'}} for a File queryset, kind being the content type before '/'.
+
+    Grouped in SQL on the stored content_kind column, so it returns one row per kind
+    instead of one per file.
+    """
+    rows = files.values('content_kind').annotate(count=models.Count('id'), size=models.Sum('size')).order_by()
+    return {row['content_kind']: {'count': row['count'], 'size': row['size'] or 0} for row in rows}
 
 class ChunkedUpload(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -12,14 +12,15 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'files_count', 'folders_count', 'total_size', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
         
+    # Querysets from annotate_project_stats carry the numbers already, others fall back to a query each
     def get_files_count(self, obj):
-        return obj.get_files_count()
+        return obj.files_count if hasattr(obj, 'files_count') else obj.get_files_count()
     
     def get_folders_count(self, obj):
-        return obj.get_folders_count()
+        return obj.folders_count if hasattr(obj, 'folders_count') else obj.get_folders_count()
     
     def get_total_size(self, obj):
-        return obj.get_total_size()
+        return obj.total_size if hasattr(obj, 'total_size') else obj.get_total_size()
         
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
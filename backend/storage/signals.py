@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import invalidate_stats_caches
+from video_processing.hls import remove_hls
+from .models import Project, Folder, File
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def drop_stats_caches(sender, instance, **kwargs):
+    """Project counts and sizes in storage_stats/projects_list changed, rebuild them on the next GET"""
+    invalidate_stats_caches(instance.user_id)
+
+
+@receiver(post_delete, sender=File)
+def drop_hls_rendition(sender, instance, **kwargs):
+    if instance.content_type.startswith('video/'):
+        remove_hls(instance.id)
@@ -1,10 +1,10 @@
 from django.conf import settings
 from django.db import transaction
-from django.http import HttpResponse
+from core.downloads import file_download_response
 from django.shortcuts import get_object_or_404
 import os
 import shutil
-from .models import Folder, File, ChunkedUpload, Project, Assignment, FileStatus
+from .models import Folder, File, ChunkedUpload, Project, Assignment, FileStatus, annotate_project_stats, content_kind_breakdown, folder_ancestry
 from .serializers import (
     FolderSerializer, FileSerializer, ChunkUploadSerializer, 
     CompleteUploadSerializer, ProjectSerializer, ProjectTreeSerializer,
@@ -21,7 +21,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Project.objects.filter(user=self.request.user)
+        return annotate_project_stats(Project.objects.filter(user=self.request.user))
     
     @action(detail=True, methods=['get'])
     def tree(self, request, pk=None):
@@ -87,26 +87,16 @@ class ProjectViewSet(viewsets.ModelViewSet):
         project = self.get_object()
         
         stats = {
-            'total_files': project.get_files_count(),
-            'total_folders': project.get_folders_count(),
-            'total_size': project.get_total_size(),
+            'total_files': project.files_count,
+            'total_folders': project.folders_count,
+            'total_size': project.total_size,
             'storage_breakdown': self.get_storage_breakdown(project)
         }
         
         return Response(stats)
     
     def get_storage_breakdown(self, project):
-        files = project.files.all()
-        breakdown = {}
-        
-        for file_obj in files:
-            content_type = file_obj.content_type.split('/')[0] if '/' in file_obj.content_type else 'other'
-            if content_type not in breakdown:
-                breakdown[content_type] = {'count': 0, 'size': 0}
-            breakdown[content_type]['count'] += 1
-            breakdown[content_type]['size'] += file_obj.size
-            
-        return breakdown
+        return content_kind_breakdown(project.files.all())
 
 class FolderViewSet(viewsets.ModelViewSet):
     serializer_class = FolderSerializer
@@ -142,16 +132,11 @@ class FolderViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def breadcrumb(self, request, pk=None):
         folder = self.get_object()
-        breadcrumb = []
-        current = folder
-        
-        while current:
-            breadcrumb.insert(0, {
-                'id': str(current.id),
-                'name': current.name,
-                'path': current.path
-            })
-            current = current.parent
+        breadcrumb = [{
+            'id': str(ancestor.id),
+            'name': ancestor.name,
+            'path': ancestor.path
+        } for ancestor in folder_ancestry(folder.pk, request.user)]
         
         breadcrumb.insert(0, {
             'id': str(folder.project.id),
@@ -167,7 +152,8 @@ class FileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return File.objects.filter(user=self.request.user)
+        # FileSerializer.file_path reads project and folder, join them instead of a query per row
+        return File.objects.filter(user=self.request.user).select_related('project', 'folder')
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -177,14 +163,10 @@ class FileViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         file_obj = self.get_object()
-        file_path = file_obj.file.path
-        
-        if os.path.exists(file_path):
-            with open(file_path, 'rb') as fh:
-                response = HttpResponse(fh.read(), content_type=file_obj.content_type)
-                response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
-                return response
-        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return file_download_response(file_obj.file.path, file_obj.content_type, file_obj.name, request=request)
+        except FileNotFoundError:
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
     
     @action(detail=False, methods=['post'])
     def move(self, request):
@@ -0,0 +1,45 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import shared_cache, user_cache_key
+
+# Seconds an authenticated user is served from cache; saves drop it earlier
+USER_CACHE_TTL = 30
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that keeps the token's user in the cache for USER_CACHE_TTL.
+
+    Range and preview requests arrive in bursts for the same user, so this saves the
+    users SELECT on all but the first. Entries are dropped on User save/delete and on
+    storage_used changes (users.models.invalidate_user_caches).
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        
+        key = user_cache_key(user_id)
+        user = shared_cache.get(key)
+        if user is None:
+            try:
+                # Role checks in the views read workflow_role, cache it along with the user
+                user = self.user_model.objects.select_related('workflow_role').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            shared_cache.set(key, user, USER_CACHE_TTL)
+        
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        
+        return user
@@ -1,8 +1,41 @@
+from django.core.cache import caches
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
+from django.utils.connection import ConnectionProxy
 import uuid
 
+# Cache of entries invalidated across processes, see CACHES['shared'] in settings
+shared_cache = ConnectionProxy(caches, 'shared')
+
+def storage_stats_cache_key(user_id):
+    return f"stats:{user_id}"
+
+def projects_list_cache_key(user_id):
+    return f"projects:{user_id}"
+
+def user_cache_key(user_id):
+    return f"jwtuser:{user_id}"
+
+def invalidate_stats_caches(user_id):
+    # Per-user dashboard payloads, rebuilt on the next GET
+    shared_cache.delete_many([storage_stats_cache_key(user_id), projects_list_cache_key(user_id)])
+
+# Per-process user caches (the FastAPI app's) register here to be dropped with the shared entries
+_user_cache_hooks = []
+
+def on_user_cache_invalidated(hook):
+    _user_cache_hooks.append(hook)
+    return hook
+
+def invalidate_user_caches(user_id):
+    # Cached user (JWT auth) and the dashboard payloads all embed storage_used
+    shared_cache.delete_many([storage_stats_cache_key(user_id), projects_list_cache_key(user_id), user_cache_key(user_id)])
+    for hook in _user_cache_hooks:
+        hook(user_id)
+
 class WorkflowRole(models.Model):
     SUPERUSER = 'superuser'
     ADMIN = 'admin'
@@ -48,11 +81,11 @@ class User(AbstractUser):
         return (self.storage_used + file_size) <= self.storage_quota
     
     def update_storage_used(self, file_size, subtract=False):
-        if subtract:
-            self.storage_used = max(0, self.storage_used - file_size)
-        else:
-            self.storage_used += file_size
-        self.save(update_fields=['storage_used'])
+        delta = -file_size if subtract else file_size
+        # Computed in SQL so concurrent uploads and deletes don't overwrite each other
+        User.objects.filter(pk=self.pk).update(storage_used=Greatest(F('storage_used') + delta, 0))
+        self.storage_used = max(0, self.storage_used + delta)
+        invalidate_user_caches(self.pk)
     
     def is_superuser_role(self):
         return self.is_superuser or (self.workflow_role and self.workflow_role.name == WorkflowRole.SUPERUSER)
@@ -56,7 +56,7 @@ class ProjectAccessPermission(permissions.BasePermission):
         if not project:
             return False
         
-        if project.user == request.user:
+        if project.user_id == request.user.id:
             return True
         
         return request.user.project_assignments.filter(
@@ -83,7 +83,7 @@ class WorkflowAccessPermission(permissions.BasePermission):
         if not project:
             return False
         
-        if hasattr(obj, 'user') and obj.user == request.user:
+        if getattr(obj, 'user_id', None) == request.user.id:
             return True
         
         return request.user.project_assignments.filter(
@@ -98,7 +98,7 @@ def has_project_access(user, project):
     if user.is_admin_role():
         return True
     
-    if project.user == user:
+    if project.user_id == user.id:
         return True
     
     return user.project_assignments.filter(
@@ -137,7 +137,7 @@ class PermissionService:
         if user.is_admin_role():
             return True
         
-        if project.user == user:
+        if project.user_id == user.id:
             return True
         
         return ProjectAssignment.objects.filter(
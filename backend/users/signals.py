@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User, invalidate_user_caches
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    """Forget the user cached by CachedJWTAuthentication and the FastAPI app"""
+    invalidate_user_caches(instance.pk)
@@ -446,10 +446,10 @@ class UserPermissionsView(generics.GenericAPIView):
         if user.workflow_role:
             permissions['accessible_projects'] = [
                 {
-                    'id': str(project.id),
-                    'name': project.name
+                    'id': str(project_id),
+                    'name': name
                 }
-                for project in user.get_accessible_projects()[:10]  # Limit to 10 for performance
+                for project_id, name in user.get_accessible_projects().values_list('id', 'name')[:10]  # Limit to 10 for performance
             ]
         
         return Response(permissions)
@@ -0,0 +1,267 @@
+"""Header-only probing of MP4/MOV and Matroska/WebM files.
+
+Reads just the boxes/elements that name the codecs and video size and returns them in
+ffprobe's JSON shape ({'streams': [...], 'format': {...}}), so callers of
+VideoProcessor.get_video_info don't need to know which path produced the result.
+Anything unrecognised returns None and the caller falls back to ffprobe.
+"""
+import os
+import struct
+from typing import Dict, List, Optional
+
+# Largest moov box / Matroska header region read into memory
+MAX_HEADER_BYTES = 16 * 1024 * 1024
+MKV_HEADER_BYTES = 1024 * 1024
+
+MP4_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264',
+    b'hvc1': 'hevc', b'hev1': 'hevc',
+    b'vp08': 'vp8', b'vp09': 'vp9',
+    b'av01': 'av1',
+    b'mp4v': 'mpeg4',
+    b'mp4a': 'aac',
+    b'Opus': 'opus',
+    b'ac-3': 'ac3', b'ec-3': 'eac3',
+    b'fLaC': 'flac',
+}
+MP4_HANDLERS = {b'vide': 'video', b'soun': 'audio'}
+
+MKV_CODECS = {
+    'V_MPEG4/ISO/AVC': 'h264',
+    'V_MPEGH/ISO/HEVC': 'hevc',
+    'V_VP8': 'vp8',
+    'V_VP9': 'vp9',
+    'V_AV1': 'av1',
+    'A_AAC': 'aac',
+    'A_OPUS': 'opus',
+    'A_VORBIS': 'vorbis',
+    'A_AC3': 'ac3',
+    'A_EAC3': 'eac3',
+    'A_FLAC': 'flac',
+}
+MKV_TRACK_TYPES = {1: 'video', 2: 'audio'}
+
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+# Matroska element IDs (with their length marker bits)
+EBML_HEADER = 0x1A45DFA3
+EBML_DOCTYPE = 0x4282
+MKV_SEGMENT = 0x18538067
+MKV_CLUSTER = 0x1F43B675
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+
+
+def fast_probe(path: str, size: Optional[int] = None) -> Optional[Dict]:
+    """ffprobe-shaped info read from the container headers, None when ffprobe is needed.
+
+    size is the file's length when the caller has already stat()ed it.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if size is None:
+                size = os.fstat(f.fileno()).st_size
+            head = f.read(12)
+            if head[:4] == EBML_MAGIC:
+                f.seek(0)
+                return _probe_matroska(f.read(MKV_HEADER_BYTES), size)
+            if head[4:8] == b'ftyp':
+                return _probe_mp4(f, size)
+    except (OSError, struct.error, ValueError, IndexError):
+        return None
+    return None
+
+
+def _info(streams: List[Dict], format_name: str, size: int) -> Optional[Dict]:
+    # Only answer when every track was understood, so nothing ffprobe would report is lost
+    if not streams or any(stream is None for stream in streams):
+        return None
+    for index, stream in enumerate(streams):
+        stream['index'] = index
+    return {'streams': streams, 'format': {'format_name': format_name, 'size': str(size)}}
+
+
+# MP4 / QuickTime
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """(type, payload start, payload end) of each box in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        box_size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < header or pos + box_size > end:
+            raise ValueError('truncated box')
+        yield box_type, pos + header, pos + box_size
+        pos += box_size
+
+
+def _child(data: bytes, start: int, end: int, box_type: bytes):
+    for child_type, child_start, child_end in _iter_boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _read_moov(f, size: int) -> Optional[bytes]:
+    # moov sits after mdat in files written without faststart, so seek box by box
+    pos = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        header = f.read(16)
+        box_size, box_type = struct.unpack_from('>I4s', header)
+        if box_size == 1:
+            box_size = struct.unpack_from('>Q', header, 8)[0]
+        elif box_size == 0:
+            box_size = size - pos
+        if box_size < 8:
+            return None
+        if box_type == b'moov':
+            if box_size > MAX_HEADER_BYTES:
+                return None
+            f.seek(pos)
+            return f.read(box_size)
+        pos += box_size
+    return None
+
+
+def _probe_mp4(f, size: int) -> Optional[Dict]:
+    moov = _read_moov(f, size)
+    if moov is None:
+        return None
+    streams = []
+    moov_start, moov_end = next(_iter_boxes(moov))[1:]
+    for box_type, start, end in _iter_boxes(moov, moov_start, moov_end):
+        if box_type != b'trak':
+            continue
+        mdia = _child(moov, start, end, b'mdia')
+        if mdia is None:
+            return None
+        hdlr = _child(moov, *mdia, b'hdlr')
+        if hdlr is None:
+            return None
+        # hdlr payload: version/flags (4), pre_defined (4), handler_type (4)
+        codec_type = MP4_HANDLERS.get(moov[hdlr[0] + 8:hdlr[0] + 12])
+        if codec_type is None:
+            continue  # timecode, text and other non-media tracks
+        minf = _child(moov, *mdia, b'minf')
+        stbl = minf and _child(moov, *minf, b'stbl')
+        stsd = stbl and _child(moov, *stbl, b'stsd')
+        if not stsd:
+            return None
+        # stsd payload: version/flags (4), entry count (4), then the first sample entry
+        fourcc = struct.unpack_from('>4s', moov, stsd[0] + 12)[0]
+        codec_name = MP4_CODECS.get(fourcc)
+        if codec_name is None:
+            streams.append(None)
+            continue
+        stream = {'codec_type': codec_type, 'codec_name': codec_name, 'codec_tag_string': fourcc.decode('latin-1')}
+        if codec_type == 'video':
+            # VisualSampleEntry: box header (8), reserved (6), data ref (2), predefined (16), width, height
+            entry = stsd[0] + 8
+            stream['width'], stream['height'] = struct.unpack_from('>HH', moov, entry + 32)
+        streams.append(stream)
+    return _info(streams, 'mov,mp4,m4a,3gp,3g2,mj2', size)
+
+
+# Matroska / WebM
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool):
+    """EBML variable-length integer at pos: (value, length); all-ones sizes come back as None"""
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError('invalid EBML vint')
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def _iter_elements(data: bytes, start: int, end: int):
+    """(id, payload start, declared payload end) of each element; unknown sizes run to end.
+
+    The declared end can lie past the buffer for elements cut off by the header read.
+    """
+    pos = start
+    while pos < end:
+        element_id, id_length = _read_vint(data, pos, keep_marker=True)
+        element_size, size_length = _read_vint(data, pos + id_length, keep_marker=False)
+        payload = pos + id_length + size_length
+        payload_end = end if element_size is None else payload + element_size
+        yield element_id, payload, payload_end
+        if element_size is None:
+            return
+        pos = payload + element_size
+
+
+def _uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], 'big')
+
+
+def _probe_matroska(data: bytes, size: int) -> Optional[Dict]:
+    doctype = None
+    tracks = None
+    for element_id, start, end in _iter_elements(data, 0, len(data)):
+        if element_id == EBML_HEADER:
+            for child_id, child_start, child_end in _iter_elements(data, start, end):
+                if child_id == EBML_DOCTYPE:
+                    doctype = data[child_start:child_end].rstrip(b'\x00').decode('ascii')
+        elif element_id == MKV_SEGMENT:
+            # The segment holds the whole file, only its leading elements are in data
+            for child_id, child_start, child_end in _iter_elements(data, start, min(end, len(data))):
+                if child_id == MKV_TRACKS:
+                    if child_end > len(data):
+                        return None
+                    tracks = (child_start, child_end)
+                    break
+                if child_id == MKV_CLUSTER:
+                    break
+            break
+    if doctype not in ('matroska', 'webm') or tracks is None:
+        return None
+
+    streams = []
+    for element_id, start, end in _iter_elements(data, *tracks):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        track_type = codec_id = None
+        width = height = None
+        for child_id, child_start, child_end in _iter_elements(data, start, end):
+            if child_id == MKV_TRACK_TYPE:
+                track_type = _uint(data, child_start, child_end)
+            elif child_id == MKV_CODEC_ID:
+                codec_id = data[child_start:child_end].rstrip(b'\x00').decode('ascii')
+            elif child_id == MKV_VIDEO:
+                for video_id, video_start, video_end in _iter_elements(data, child_start, child_end):
+                    if video_id == MKV_PIXEL_WIDTH:
+                        width = _uint(data, video_start, video_end)
+                    elif video_id == MKV_PIXEL_HEIGHT:
+                        height = _uint(data, video_start, video_end)
+        codec_type = MKV_TRACK_TYPES.get(track_type)
+        if codec_type is None:
+            continue  # subtitles and other non-media tracks
+        codec_name = MKV_CODECS.get(codec_id)
+        if codec_name is None or (codec_type == 'video' and not (width and height)):
+            streams.append(None)
+            continue
+        stream = {'codec_type': codec_type, 'codec_name': codec_name}
+        if codec_type == 'video':
+            stream['width'], stream['height'] = width, height
+        streams.append(stream)
+    return _info(streams, 'matroska,webm', size)
@@ -0,0 +1,81 @@
+"""HLS renditions of uploaded videos.
+
+Large videos are packaged once into an fMP4 HLS playlist under MEDIA_ROOT/hls/<file id>/,
+with the streams copied rather than re-encoded. The playlist and segments are plain media
+files, so nginx serves them and players stream without a Django request per segment.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HLS_PLAYLIST_NAME = 'index.m3u8'
+
+
+def hls_dir(file_id) -> str:
+    return os.path.join(settings.MEDIA_ROOT, 'hls', str(file_id))
+
+
+def hls_playlist_name(file_id) -> Optional[str]:
+    """Playlist path relative to MEDIA_ROOT when the file has an HLS rendition, else None"""
+    if not os.path.exists(os.path.join(hls_dir(file_id), HLS_PLAYLIST_NAME)):
+        return None
+    return f'hls/{file_id}/{HLS_PLAYLIST_NAME}'
+
+
+def wants_hls(size: int) -> bool:
+    return bool(settings.HLS_MIN_SIZE) and size >= settings.HLS_MIN_SIZE
+
+
+def build_hls_playlist(input_path: str, file_id) -> Optional[str]:
+    """Package input_path as an HLS VOD playlist, returning its path or None on failure.
+
+    ffmpeg writes into a scratch directory that is renamed into place when it finishes,
+    so a playlist that exists is always complete.
+    """
+    target = hls_dir(file_id)
+    playlist = os.path.join(target, HLS_PLAYLIST_NAME)
+    if os.path.exists(playlist):
+        return playlist
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f'.{file_id}-', dir=os.path.dirname(target))
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error', '-nostdin',
+        '-i', os.path.abspath(input_path),
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(settings.HLS_SEGMENT_SECONDS),
+        '-hls_list_size', '0',
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_segment_filename', 'segment_%05d.m4s',
+        HLS_PLAYLIST_NAME,
+    ]
+    try:
+        # Relative output names keep the segment URIs in the playlist relative too
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True, timeout=3600)
+        if result.returncode != 0:
+            logger.error(f"HLS packaging failed for {input_path}: {result.stderr}")
+            return None
+        os.chmod(work_dir, settings.FILE_UPLOAD_DIRECTORY_PERMISSIONS)
+        os.rename(work_dir, target)
+        work_dir = None
+        return playlist
+    except Exception as e:
+        logger.error(f"HLS packaging error for {input_path}: {e}")
+        return None
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def remove_hls(file_id):
+    shutil.rmtree(hls_dir(file_id), ignore_errors=True)
@@ -1,58 +1,284 @@
 import os
+import atexit
+import bisect
+import functools
 import subprocess
 import json
 import tempfile
 import logging
 import psutil
+import shutil
+import threading
 import time
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 from django.conf import settings
+from django.core.cache import cache
+from video_processing.container_probe import fast_probe
 
 logger = logging.getLogger(__name__)
 
+try:
+    import pynvml
+    PYNVML_AVAILABLE = True
+except ImportError:
+    PYNVML_AVAILABLE = False
+
+# NVML device handles, filled on first use; empty when NVML is unusable
+_NVML_HANDLES: Optional[List] = None
+_nvml_lock = threading.Lock()
+
+def _nvml_handles() -> List:
+    global _NVML_HANDLES
+    if _NVML_HANDLES is None:
+        with _nvml_lock:
+            if _NVML_HANDLES is None:
+                handles = []
+                if PYNVML_AVAILABLE:
+                    try:
+                        # Init once per process, it is the expensive part of NVML
+                        pynvml.nvmlInit()
+                        atexit.register(pynvml.nvmlShutdown)
+                        handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+                    except pynvml.NVMLError as e:
+                        logger.info(f"NVML not usable, falling back to nvidia-smi: {e}")
+                _NVML_HANDLES = handles
+    return _NVML_HANDLES
+
+def _nvml_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+class GPUSampler:
+    """Keeps one `nvidia-smi -lms` process running and holds its latest usage rows.
+
+    Saves the fork and driver init that a one-shot nvidia-smi pays on every call.
+    """
+    def __init__(self, interval_ms: int = 1000):
+        self.interval_ms = interval_ms
+        self._proc = None
+        self._thread = None
+        self._latest = None
+        self._latest_at = 0.0
+        self._lock = threading.Lock()
+    
+    def start(self):
+        if self._proc is not None:
+            return
+        cmd = [
+            'nvidia-smi',
+            '--query-gpu=index,utilization.gpu,memory.used',
+            '--format=csv,noheader,nounits',
+            '-lms', str(self.interval_ms)
+        ]
+        try:
+            self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError as e:
+            logger.warning(f"Cannot start nvidia-smi sampler: {e}")
+            return
+        self._thread = threading.Thread(target=self._read, name="gpu_sampler", daemon=True)
+        self._thread.start()
+    
+    def _read(self):
+        rows = []
+        for line in self._proc.stdout:
+            parts = line.strip().split(', ')
+            if len(parts) < 3:
+                continue
+            try:
+                index, util, mem_used = int(parts[0]), int(parts[1]), int(parts[2])
+            except ValueError:
+                continue
+            # Each sample lists every GPU from index 0, so 0 starts a new snapshot
+            if index == 0 and rows:
+                self._publish(rows)
+                rows = []
+            rows.append({'gpu_utilization': util, 'memory_used_mb': mem_used})
+            static_info = GPUMonitor.get_gpu_static_info()
+            if static_info and len(rows) == static_info['gpu_count']:
+                self._publish(rows)
+                rows = []
+    
+    def _publish(self, rows: List[Dict]):
+        with self._lock:
+            self._latest = rows
+            self._latest_at = time.monotonic()
+    
+    def latest(self) -> Optional[List[Dict]]:
+        with self._lock:
+            # Treat a sampler that stopped printing as absent
+            if self._latest is None or time.monotonic() - self._latest_at > 5 * self.interval_ms / 1000:
+                return None
+            return [dict(row) for row in self._latest]
+    
+    def stop(self):
+        if self._proc is None:
+            return
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+        self._proc = None
+        self._thread = None
+        with self._lock:
+            self._latest = None
+
+_gpu_sampler = GPUSampler()
+
+# get_gpu_static_info's result once a query succeeded; failures are retried on the next call
+_gpu_static_info: Optional[Dict] = None
+
+# (monotonic read time, result, seconds it stays valid) of the last get_nvidia_gpu_usage call
+_gpu_usage_cache = (0.0, None, 0.0)
+_gpu_usage_lock = threading.Lock()
+
 class GPUMonitor:
     @staticmethod
-    def get_nvidia_gpu_usage() -> Optional[Dict]:
+    def start_sampler():
+        # NVML queries are cheap enough to run per call, no sampler needed
+        if not _nvml_handles() and GPUMonitor.get_gpu_static_info():
+            _gpu_sampler.start()
+    
+    @staticmethod
+    def stop_sampler():
+        _gpu_sampler.stop()
+    
+    @staticmethod
+    def get_gpu_static_info() -> Optional[Dict]:
+        """Name, driver and VRAM size per GPU, kept after the first successful query since they never change"""
+        global _gpu_static_info
+        if _gpu_static_info is None:
+            _gpu_static_info = GPUMonitor._read_gpu_static_info()
+        return _gpu_static_info
+    
+    @staticmethod
+    def _read_gpu_static_info() -> Optional[Dict]:
+        handles = _nvml_handles()
+        if handles:
+            try:
+                driver_version = _nvml_str(pynvml.nvmlSystemGetDriverVersion())
+                gpus = [{
+                    'name': _nvml_str(pynvml.nvmlDeviceGetName(h)),
+                    'driver_version': driver_version,
+                    'memory_total_mb': pynvml.nvmlDeviceGetMemoryInfo(h).total // (1024 * 1024)
+                } for h in handles]
+                return {'gpus': gpus, 'gpu_count': len(gpus)}
+            except pynvml.NVMLError as e:
+                logger.warning(f"NVML query failed: {e}")
+        
         try:
             cmd = [
-                'nvidia-smi', 
-                '--query-gpu=utilization.gpu,memory.used,memory.total,name', 
+                'nvidia-smi',
+                '--query-gpu=name,driver_version,memory.total',
                 '--format=csv,noheader,nounits'
             ]
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
             
             if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
                 gpus = []
-                
-                for line in lines:
+                for line in result.stdout.strip().split('\n'):
                     parts = line.split(', ')
-                    if len(parts) >= 4:
-                        gpu_util = int(parts[0])
-                        mem_used = int(parts[1])
-                        mem_total = int(parts[2])
-                        gpu_name = parts[3]
-                        
-                        mem_usage_percent = (mem_used / mem_total) * 100
-                        
+                    if len(parts) >= 3:
                         gpus.append({
-                            'name': gpu_name,
-                            'gpu_utilization': gpu_util,
-                            'memory_used_mb': mem_used,
-                            'memory_total_mb': mem_total,
-                            'memory_usage_percent': mem_usage_percent
+                            'name': parts[0],
+                            'driver_version': parts[1],
+                            'memory_total_mb': int(parts[2])
                         })
-                
-                return {'gpus': gpus, 'available': True}
-            
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
+                return {'gpus': gpus, 'gpu_count': len(gpus)}
+        
+        except Exception as e:
             logger.warning(f"Cannot get NVIDIA GPU info: {e}")
         
         return None
     
     @staticmethod
-    def should_use_gpu(gpu_threshold_util=80, vram_threshold=85) -> Tuple[bool, str]:
-        gpu_info = GPUMonitor.get_nvidia_gpu_usage()
+    def get_gpu_dynamic_info() -> Optional[List[Dict]]:
+        """Live utilization and VRAM use per GPU"""
+        handles = _nvml_handles()
+        if handles:
+            try:
+                return [{
+                    'gpu_utilization': pynvml.nvmlDeviceGetUtilizationRates(h).gpu,
+                    'memory_used_mb': pynvml.nvmlDeviceGetMemoryInfo(h).used // (1024 * 1024)
+                } for h in handles]
+            except pynvml.NVMLError as e:
+                logger.warning(f"NVML query failed: {e}")
+        
+        usage = _gpu_sampler.latest()
+        if usage is not None:
+            return usage
+        
+        try:
+            cmd = [
+                'nvidia-smi',
+                '--query-gpu=utilization.gpu,memory.used',
+                '--format=csv,noheader,nounits'
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+            
+            if result.returncode == 0:
+                usage = []
+                for line in result.stdout.strip().split('\n'):
+                    parts = line.split(', ')
+                    if len(parts) >= 2:
+                        usage.append({
+                            'gpu_utilization': int(parts[0]),
+                            'memory_used_mb': int(parts[1])
+                        })
+                return usage
+        
+        except Exception as e:
+            logger.warning(f"Cannot get NVIDIA GPU usage: {e}")
+        
+        return None
+    
+    @staticmethod
+    def get_nvidia_gpu_usage() -> Optional[Dict]:
+        """Merged static and live GPU info, reused for GPU_POLL_INTERVAL_SECONDS.
+
+        A failed read is reused for GPU_FAILURE_TTL_SECONDS, or GPU_ABSENT_TTL_SECONDS when the
+        host has no GPU at all (no NVML devices and no nvidia-smi), so transient errors don't
+        pin encoding to the CPU for long.
+        """
+        global _gpu_usage_cache
+        with _gpu_usage_lock:
+            read_at, gpu_info, ttl = _gpu_usage_cache
+            if read_at and time.monotonic() - read_at < ttl:
+                return gpu_info
+            gpu_info = GPUMonitor._read_gpu_usage()
+            if gpu_info is not None:
+                ttl = getattr(settings, 'GPU_POLL_INTERVAL_SECONDS', 5)
+            elif not _nvml_handles() and shutil.which('nvidia-smi') is None:
+                ttl = getattr(settings, 'GPU_ABSENT_TTL_SECONDS', 3600)
+            else:
+                ttl = getattr(settings, 'GPU_FAILURE_TTL_SECONDS', 60)
+            _gpu_usage_cache = (time.monotonic(), gpu_info, ttl)
+            return gpu_info
+    
+    @staticmethod
+    def _read_gpu_usage() -> Optional[Dict]:
+        static_info = GPUMonitor.get_gpu_static_info()
+        if not static_info:
+            return None
+        usage = GPUMonitor.get_gpu_dynamic_info()
+        if usage is None:
+            return None
+        
+        gpus = []
+        for static, live in zip(static_info['gpus'], usage):
+            mem_total = static['memory_total_mb']
+            gpus.append({
+                'name': static['name'],
+                'gpu_utilization': live['gpu_utilization'],
+                'memory_used_mb': live['memory_used_mb'],
+                'memory_total_mb': mem_total,
+                'memory_usage_percent': (live['memory_used_mb'] / mem_total) * 100 if mem_total else 0.0
+            })
+        return {'gpus': gpus, 'available': True}
+    
+    @staticmethod
+    def should_use_gpu(gpu_threshold_util=80, vram_threshold=85, gpu_info: Optional[Dict] = None) -> Tuple[bool, str]:
+        if gpu_info is None:
+            gpu_info = GPUMonitor.get_nvidia_gpu_usage()
         
         if not gpu_info:
             return False, "No NVIDIA GPU detected or nvidia-smi not available"
@@ -70,31 +296,114 @@ class GPUMonitor:
         
         return False, "All GPUs are busy or overloaded"
 
+# Seconds an ffprobe result stays in the shared cache; the key changes with the file anyway
+FFPROBE_CACHE_TTL = 86400
+
+class ProbeError(Exception):
+    pass
+
+@functools.lru_cache(maxsize=1)
+def _probe_semaphore() -> threading.BoundedSemaphore:
+    return threading.BoundedSemaphore(getattr(settings, 'FFPROBE_MAX_CONCURRENCY', 4))
+
+class _ProbeFlight:
+    """One ffprobe run that concurrent callers for the same file wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.info: Optional[Dict] = None
+
+# cache key -> the probe currently running for it
+_probe_flights: Dict[str, _ProbeFlight] = {}
+_probe_flights_lock = threading.Lock()
+
+def _run_ffprobe(path: str) -> Dict:
+    cmd = [
+        'ffprobe', '-v', 'quiet', 
+        '-threads', '1',
+        '-print_format', 'json', 
+        '-show_format', '-show_streams',
+        path
+    ]
+    # Bounded so a burst of previews can't fork an ffprobe per request
+    with _probe_semaphore():
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise ProbeError(f"ffprobe failed: {result.stderr}")
+    return json.loads(result.stdout)
+
+@functools.lru_cache(maxsize=1024)
+def _probe_cached(path: str, mtime_ns: int, size: int) -> Dict:
+    """ffprobe JSON for one version of a file, per process and then in the shared cache.
+
+    mtime and size are part of the key so a rewritten file is probed again. Concurrent
+    misses for the same file share one ffprobe run. Failures raise ProbeError and are not
+    cached.
+    """
+    cache_key = f"ffprobe:{path}:{mtime_ns}:{size}"
+    info = cache.get(cache_key)
+    if info is not None:
+        return info
+    
+    with _probe_flights_lock:
+        flight = _probe_flights.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = _probe_flights[cache_key] = _ProbeFlight()
+    
+    if not leader:
+        flight.done.wait(timeout=60)
+        if flight.info is not None:
+            return flight.info
+        # The leading probe failed or is stuck, try once more on our own
+        return _run_ffprobe(path)
+    
+    try:
+        flight.info = _run_ffprobe(path)
+        cache.set(cache_key, flight.info, timeout=FFPROBE_CACHE_TTL)
+        return flight.info
+    finally:
+        with _probe_flights_lock:
+            del _probe_flights[cache_key]
+        flight.done.set()
+
+# Frame-size tiers for encoder settings: up to 1080p, up to 1440p, up to 2160p, larger
+_TIER_MAX_PIXELS = (1920 * 1080, 2560 * 1440, 3840 * 2160)
+_TIER_VRAM_MB = (200, 350, 500, 800)
+# NVENC (bitrate, maxrate, bufsize) and libx264 (preset, crf) per tier
+_TIER_NVENC_RATES = (("2M", "4M", "4M"), ("4M", "6M", "6M"), ("8M", "12M", "12M"), ("16M", "24M", "24M"))
+_TIER_X264 = (("medium", "23"), ("fast", "24"), ("faster", "25"), ("faster", "25"))
+
 class VideoProcessor:
     def __init__(self, input_path: str):
         self.input_path = input_path
         self.video_info = None
+
+    @functools.cached_property
+    def stat_result(self) -> os.stat_result:
+        """The input's one stat(), shared by the header probe and the ffprobe cache key"""
+        return os.stat(self.input_path)
         
     def get_video_info(self) -> Optional[Dict]:
         if self.video_info:
             return self.video_info
-            
+
         try:
-            cmd = [
-                'ffprobe', '-v', 'quiet', 
-                '-print_format', 'json', 
-                '-show_format', '-show_streams',
-                self.input_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            st = self.stat_result
+        except OSError as e:
+            logger.error(f"ffprobe error: {e}")
+            return None
             
-            if result.returncode == 0:
-                self.video_info = json.loads(result.stdout)
-                return self.video_info
-            else:
-                logger.error(f"ffprobe failed: {result.stderr}")
-                return None
-                
+        # MP4/MOV and Matroska/WebM headers are parsed directly, ffprobe only for the rest
+        self.video_info = fast_probe(self.input_path, st.st_size)
+        if self.video_info:
+            return self.video_info
+        
+        try:
+            self.video_info = _probe_cached(os.path.abspath(self.input_path), st.st_mtime_ns, st.st_size)
+            return self.video_info
+        except ProbeError as e:
+            logger.error(str(e))
+            return None
         except Exception as e:
             logger.error(f"ffprobe error: {e}")
             return None
@@ -124,11 +433,27 @@ class VideoProcessor:
         
         return 1920, 1080
     
+    def probe_all(self) -> Dict:
+        info = self.get_video_info()
+        video_streams = [s for s in (info or {}).get('streams', []) if s.get('codec_type') == 'video']
+        stream = video_streams[0] if video_streams else {}
+        
+        width = stream.get('width', 1920)
+        height = stream.get('height', 1080)
+        
+        return {
+            'info': info,
+            'is_h264': stream.get('codec_name', '').lower() == 'h264',
+            'w': width,
+            'h': height,
+            'vram': self.estimate_vram_usage()
+        }
+    
     def process_video(self, output_path: str) -> Tuple[bool, str]:
-        should_use_gpu, gpu_reason = GPUMonitor.should_use_gpu()
+        gpu_info = GPUMonitor.get_nvidia_gpu_usage()
+        should_use_gpu, gpu_reason = GPUMonitor.should_use_gpu(gpu_info=gpu_info)
         
         if should_use_gpu:
-            gpu_info = GPUMonitor.get_nvidia_gpu_usage()
             if gpu_info:
                 for i, gpu in enumerate(gpu_info['gpus']):
                     estimated_vram = self.estimate_vram_usage()
@@ -148,38 +473,17 @@ class VideoProcessor:
         else:
             return False, "Both GPU and CPU encoding failed"
     
-    def estimate_vram_usage(self) -> int:
+    def resolution_tier(self) -> int:
+        """Index into the _TIER_* tables for this video's frame size"""
         width, height = self.get_video_resolution()
-        
-        if width * height <= 1920 * 1080:
-            return 200
-        elif width * height <= 2560 * 1440:
-            return 350
-        elif width * height <= 3840 * 2160:
-            return 500
-        else:
-            return 800
+        return bisect.bisect_left(_TIER_MAX_PIXELS, width * height)
+    
+    def estimate_vram_usage(self) -> int:
+        return _TIER_VRAM_MB[self.resolution_tier()]
     
     def convert_to_h264_gpu(self, output_path: str, gpu_id: int = 0) -> bool:
         try:
-            width, height = self.get_video_resolution()
-            
-            if width * height <= 1920 * 1080:
-                video_bitrate = "2M"
-                maxrate = "4M"
-                bufsize = "4M"
-            elif width * height <= 2560 * 1440:
-                video_bitrate = "4M"
-                maxrate = "6M"
-                bufsize = "6M"
-            elif width * height <= 3840 * 2160:
-                video_bitrate = "8M"
-                maxrate = "12M"
-                bufsize = "12M"
-            else:
-                video_bitrate = "16M"
-                maxrate = "24M"
-                bufsize = "24M"
+            video_bitrate, maxrate, bufsize = _TIER_NVENC_RATES[self.resolution_tier()]
             
             cmd = [
                 'ffmpeg', '-y',
@@ -215,17 +519,7 @@ class VideoProcessor:
     
     def convert_to_h264_cpu(self, output_path: str) -> bool:
         try:
-            width, height = self.get_video_resolution()
-            
-            if width * height <= 1920 * 1080:
-                preset = "medium"
-                crf = "23"
-            elif width * height <= 2560 * 1440:
-                preset = "fast"
-                crf = "24"
-            else:
-                preset = "faster"
-                crf = "25"
+            preset, crf = _TIER_X264[self.resolution_tier()]
             
             cmd = [
                 'ffmpeg', '-y',
@@ -260,17 +554,16 @@ class VideoProcessor:
     def process_video(self, output_path: str) -> Tuple[bool, str]:
         if self.is_h264_already():
             try:
-                import shutil
                 shutil.copy2(self.input_path, output_path)
                 return True, "Video already in H.264 format, copied without conversion"
             except Exception as e:
                 return False, f"Failed to copy H.264 video: {e}"
         
-        should_use_gpu, gpu_reason = GPUMonitor.should_use_gpu()
+        gpu_info = GPUMonitor.get_nvidia_gpu_usage()
+        should_use_gpu, gpu_reason = GPUMonitor.should_use_gpu(gpu_info=gpu_info)
         
         if should_use_gpu:
             estimated_vram = self.estimate_vram_usage()
-            gpu_info = GPUMonitor.get_nvidia_gpu_usage()
             
             if gpu_info:
                 for i, gpu in enumerate(gpu_info['gpus']):
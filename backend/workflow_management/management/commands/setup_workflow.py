@@ -219,7 +219,6 @@ class Command(BaseCommand):
         
         directories = [
             os.path.join(settings.MEDIA_ROOT, 'assignments'),
-            os.path.join(settings.MEDIA_ROOT, 'temp', 'extract'),
             os.path.join(settings.MEDIA_ROOT, 'workflow_temp'),
             os.path.join(settings.BASE_DIR, 'logs', 'workflow'),
         ]
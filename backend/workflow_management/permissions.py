@@ -65,7 +65,7 @@ class CanAccessAssignment(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        if hasattr(obj, 'user') and obj.user == request.user:
+        if getattr(obj, 'user_id', None) == request.user.id:
             return True
         
         return request.user.workflow_role and request.user.workflow_role.name in [WorkflowRole.ADMIN, WorkflowRole.MANAGER]
@@ -96,7 +96,7 @@ class ProjectAccessPermission(permissions.BasePermission):
         if not project:
             return False
         
-        if project.user == request.user:
+        if project.user_id == request.user.id:
             return True
         
         return ProjectAssignment.objects.filter(
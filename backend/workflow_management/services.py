@@ -1,7 +1,6 @@
 import os
 import zipfile
 import tempfile
-import shutil
 from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
@@ -272,17 +271,17 @@ class ZipPackageService:
     def create_assignment_zip(assignment: Assignment) -> str:
         """Create ZIP package for an assignment"""
         
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
+        zip_filename = f"assignment_{assignment.id}_{assignment.user.username}.zip"
+        zip_path = os.path.join(settings.MEDIA_ROOT, 'assignments', zip_filename)
         
+        # Ensure directory exists
+        os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+        
+        # Built under a unique name beside zip_path and renamed over it, so concurrent builds
+        # don't write into the same file and downloads never see a half-written package
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(zip_path), suffix='.zip.tmp')
         try:
-            zip_filename = f"assignment_{assignment.id}_{assignment.user.username}.zip"
-            zip_path = os.path.join(settings.MEDIA_ROOT, 'assignments', zip_filename)
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(zip_path), exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            with os.fdopen(fd, 'wb') as tmp_file, zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
                 # Add instruction file
                 instructions = ZipPackageService._generate_instructions(assignment)
                 zip_file.writestr('INSTRUCTIONS.txt', instructions)
@@ -317,15 +316,20 @@ class ZipPackageService:
                 import json
                 zip_file.writestr('metadata.json', json.dumps(metadata, indent=2))
             
-            # Update assignment with zip path
-            assignment.zip_path = zip_path
-            assignment.save()
-            
-            return zip_path
-            
-        finally:
-            # Cleanup temp directory
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS)
+            os.replace(tmp_path, zip_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        
+        # Update assignment with zip path
+        assignment.zip_path = zip_path
+        assignment.save()
+        
+        return zip_path
     
     @staticmethod
     def _generate_instructions(assignment: Assignment) -> str:
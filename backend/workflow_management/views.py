@@ -2,7 +2,7 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse, Http404
+from django.http import Http404
 from django.db import transaction
 from django.db.models import Q, Count, Avg, Sum
 from django.utils import timezone
@@ -31,6 +31,7 @@ from .services import (
 )
 from storage.models import Project, File
 from users.models import User
+from core.downloads import file_download_response
 
 logger = logging.getLogger(__name__)
 
@@ -355,7 +356,7 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         assignment = self.get_object()
         
         # Check if user can download this assignment
-        if assignment.user != request.user and not IsManagerOrAdmin().has_permission(request, None):
+        if assignment.user_id != request.user.id and not IsManagerOrAdmin().has_permission(request, None):
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
         try:
@@ -372,10 +373,9 @@ class AssignmentViewSet(viewsets.ModelViewSet):
                 assignment.save()
             
             # Serve file
-            with open(zip_path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type='application/zip')
-                response['Content-Disposition'] = f'attachment; filename="assignment_{assignment.id}.zip"'
-                return response
+            return file_download_response(
+                zip_path, 'application/zip', f"assignment_{assignment.id}.zip", request=request
+            )
                 
         except Exception as e:
             logger.error(f"Error creating assignment package: {e}")
@@ -148,11 +148,11 @@ export default function UploadModal({
         const chunk = file.slice(start, end);
 
         const formData = new FormData();
-        formData.append('file', chunk, file.name);
         formData.append('filename', file.name);
         formData.append('chunk_number', chunkNumber.toString());
         formData.append('total_chunks', totalChunks.toString());
         formData.append('total_size', file.size.toString());
+        formData.append('chunk_offset', start.toString());
         formData.append('project_id', projectId);
         formData.append('chunk_size_name', chunkSizeName);
         
@@ -160,6 +160,9 @@ export default function UploadModal({
           formData.append('folder_id', folderId);
         }
 
+        // Fields go before the file part so the server knows them while streaming it
+        formData.append('file', chunk, file.name);
+
         const response = await fetch('http://localhost:8001/api/upload/chunk/', {
           method: 'POST',
           headers: {